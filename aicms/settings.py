@@ -131,6 +131,15 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (e.g. redis://) when running several processes so that
+# cache invalidation reaches every web and Django Q worker.
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -140,7 +149,112 @@ AI_BASE_URL = env("AI_BASE_URL")
 AI_API_KEY = env("AI_API_KEY")
 AI_API_MODEL = env("AI_API_MODEL")
 
-# Django Q configuration
+# "full" asks the LLM for whole pages; "fragment" only for the <main> element,
+# which is composed into the active layout when the page is rendered
+AI_GENERATION_MODE = env("AI_GENERATION_MODE", default="full")
+
+# Stream completions and persist the partial output every AI_STREAM_FLUSH_INTERVAL
+# seconds so visitors can watch a page being generated
+AI_STREAMING = env.bool("AI_STREAMING", default=True)
+AI_STREAM_FLUSH_INTERVAL = env.float("AI_STREAM_FLUSH_INTERVAL", default=1.0)
+
+# Token budget for page generation prompts, and the share of it each previous
+# page example may use. Token counts are exact when tiktoken is installed.
+AI_PROMPT_TOKEN_BUDGET = env.int("AI_PROMPT_TOKEN_BUDGET", default=12000)
+AI_PROMPT_EXAMPLE_TOKENS = env.int("AI_PROMPT_EXAMPLE_TOKENS", default=500)
+
+# Cache LLM responses by a hash of their exact inputs
+AI_RESPONSE_CACHE = env.bool("AI_RESPONSE_CACHE", default=True)
+AI_RESPONSE_CACHE_TTL = env.int("AI_RESPONSE_CACHE_TTL", default=30 * 24 * 3600)
+AI_RESPONSE_CACHE_MAX_ENTRIES = env.int("AI_RESPONSE_CACHE_MAX_ENTRIES", default=5000)
+AI_RESPONSE_CACHE_MAX_BYTES = env.int(
+    "AI_RESPONSE_CACHE_MAX_BYTES", default=200 * 1024 * 1024
+)
+
+# Limits on AI API usage shared by all processes through the cache (0 disables
+# a limit), the completion size assumed when reserving tokens, and retries of
+# rate-limited or failed calls with jittered exponential backoff
+AI_RATE_LIMIT_RPM = env.int("AI_RATE_LIMIT_RPM", default=0)
+AI_RATE_LIMIT_TPM = env.int("AI_RATE_LIMIT_TPM", default=0)
+AI_RATE_LIMIT_COMPLETION_TOKENS = env.int(
+    "AI_RATE_LIMIT_COMPLETION_TOKENS", default=2000
+)
+AI_MAX_RETRIES = env.int("AI_MAX_RETRIES", default=5)
+AI_RETRY_BASE_DELAY = env.float("AI_RETRY_BASE_DELAY", default=1.0)
+AI_RETRY_MAX_DELAY = env.float("AI_RETRY_MAX_DELAY", default=60.0)
+
+# Pages per bulk generation task, and how many of them run concurrently
+AI_BULK_BATCH_SIZE = env.int("AI_BULK_BATCH_SIZE", default=16)
+AI_BULK_CONCURRENCY = env.int("AI_BULK_CONCURRENCY", default=8)
+
+# Site rebuilds regenerate pages made with older inputs this many at a time,
+# and stop once more than SITE_REBUILD_ERROR_BUDGET pages failed
+SITE_REBUILD_WAVE_SIZE = env.int("SITE_REBUILD_WAVE_SIZE", default=8)
+SITE_REBUILD_ERROR_BUDGET = env.int("SITE_REBUILD_ERROR_BUDGET", default=10)
+
+# Prefix of the Django Q queues for generation tasks, one per priority lane.
+# When set, run `manage.py generation_worker` to execute them with many tasks
+# in flight per process.
+AI_GENERATION_QUEUE = env("AI_GENERATION_QUEUE", default="")
+AI_WORKER_THREADS = env.int("AI_WORKER_THREADS", default=16)
+AI_WORKER_TIMEOUT = env.int("AI_WORKER_TIMEOUT", default=300)
+
+# Percentage of a generation worker's threads each lane may use. Lanes left
+# out, such as visitor-triggered "interactive" generation, may use them all.
+AI_LANE_SHARES = env.dict(
+    "AI_LANE_SHARES",
+    cast={"value": int},
+    default={"admin": 50, "bulk": 50, "layout": 10},
+)
+
+# Connection pool shared by all AI API calls in a process. HTTP/2 is used
+# when enabled and the optional h2 package is installed.
+AI_HTTP_MAX_CONNECTIONS = env.int("AI_HTTP_MAX_CONNECTIONS", default=20)
+AI_HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int(
+    "AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", default=10
+)
+AI_HTTP_KEEPALIVE_EXPIRY = env.float("AI_HTTP_KEEPALIVE_EXPIRY", default=60.0)
+AI_HTTP_TIMEOUT = env.float("AI_HTTP_TIMEOUT", default=600.0)
+AI_HTTP_CONNECT_TIMEOUT = env.float("AI_HTTP_CONNECT_TIMEOUT", default=10.0)
+AI_HTTP2 = env.bool("AI_HTTP2", default=True)
+
+# Maximum number of compiled page templates kept in memory per process
+PAGE_TEMPLATE_CACHE_SIZE = env.int("PAGE_TEMPLATE_CACHE_SIZE", default=256)
+
+# Seconds a rendered page is kept in the cache framework
+PAGE_RENDER_CACHE_TIMEOUT = env.int("PAGE_RENDER_CACHE_TIMEOUT", default=86400)
+
+# Cache-Control for rendered pages. Caches may serve a page for max-age
+# seconds, then keep serving it for stale-while-revalidate seconds while they
+# fetch the new version. Pages being regenerated are sent with max-age=0.
+PAGE_CACHE_MAX_AGE = env.int("PAGE_CACHE_MAX_AGE", default=60)
+PAGE_CACHE_STALE_WHILE_REVALIDATE = env.int(
+    "PAGE_CACHE_STALE_WHILE_REVALIDATE", default=86400
+)
+
+# Page views are counted in the cache and added to the page in batches
+PAGE_VIEW_FLUSH_THRESHOLD = env.int("PAGE_VIEW_FLUSH_THRESHOLD", default=10)
+
+# Seconds the generation status endpoint waits for a status change, and
+# seconds clients are asked to wait before asking again
+PAGE_STATUS_LONG_POLL_TIMEOUT = env.int("PAGE_STATUS_LONG_POLL_TIMEOUT", default=10)
+PAGE_STATUS_RETRY_AFTER = env.int("PAGE_STATUS_RETRY_AFTER", default=5)
+
+# Static snapshots of published pages, written when generation completes.
+# One of "off", "file" (served by Django), "x-accel-redirect" (nginx) or
+# "x-sendfile" (Apache/lighttpd).
+PAGE_SNAPSHOT_MODE = env("PAGE_SNAPSHOT_MODE", default="off")
+PAGE_SNAPSHOT_ROOT = env("PAGE_SNAPSHOT_ROOT", default=str(BASE_DIR / "snapshots"))
+PAGE_SNAPSHOT_ACCEL_PREFIX = env("PAGE_SNAPSHOT_ACCEL_PREFIX", default="/_snapshots/")
+
+# Django Q configuration. Successful task results beyond save_limit are
+# dropped by Django Q; any task result older than the retention period is
+# pruned after tasks complete.
+TASK_RESULT_RETENTION_DAYS = env.int("TASK_RESULT_RETENTION_DAYS", default=14)
+
+# Days the timings of each generation are kept for the admin dashboard
+GENERATION_RUN_RETENTION_DAYS = env.int("GENERATION_RUN_RETENTION_DAYS", default=90)
+
 Q_CLUSTER = {
     "name": "aicms",
     "workers": 2,
@@ -148,7 +262,7 @@ Q_CLUSTER = {
     "timeout": 300,
     "retry": 360,
     "compress": True,
-    "save_limit": 250,
+    "save_limit": env.int("Q_SAVE_LIMIT", default=250),
     "queue_limit": 500,
     "cpu_affinity": 1,
     "label": "Django Q",
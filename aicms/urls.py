@@ -8,6 +8,8 @@ from django.conf import settings
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("generate/<slug:slug>/", views.generate_page, name="generate_page"),
+    path("stream/<slug:slug>/", views.stream_page, name="stream_page"),
+    path("status/<slug:slug>/", views.page_status, name="page_status"),
     path("<slug:slug>/", views.render_page, name="render_page"),
 ]
 
@@ -1,7 +1,22 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Count, F
+from django.utils import timezone
 from django.utils.html import format_html
 from django.contrib import messages
-from .models import SiteSettings, Page
+from .lanes import ADMIN
+from .models import (
+    CompletionCacheEntry,
+    GenerationRun,
+    LayoutTemplate,
+    Page,
+    SiteRebuild,
+    SiteRebuildItem,
+    SiteSettings,
+)
 from .services import AIPageGenerator
 
 
@@ -28,7 +43,7 @@ class SiteSettingsAdmin(admin.ModelAdmin):
         (
             "Layout Template",
             {
-                "fields": ("generate_layout_template",),
+                "fields": ("active_layout", "generate_layout_template"),
                 "classes": ("collapse",),
             },
         ),
@@ -52,7 +67,7 @@ class SiteSettingsAdmin(admin.ModelAdmin):
 
     generate_layout_template.short_description = "Layout Template Generation"
 
-    actions = ["generate_layout_template_action"]
+    actions = ["generate_layout_template_action", "rebuild_stale_pages_action"]
 
     def generate_layout_template_action(self, request, queryset):
         """Generate a layout template for the site based on current settings."""
@@ -86,9 +101,116 @@ class SiteSettingsAdmin(admin.ModelAdmin):
 
     generate_layout_template_action.short_description = "Generate Layout Template"
 
+    def rebuild_stale_pages_action(self, request, queryset):
+        """Regenerate, in waves, every page made with older settings."""
+        from .rebuilds import start_site_rebuild
+
+        success, message = start_site_rebuild(reason="Started from the site settings")
+        self.message_user(
+            request, message, level=messages.SUCCESS if success else messages.ERROR
+        )
+
+    rebuild_stale_pages_action.short_description = "Rebuild stale pages"
+
+
+@admin.register(LayoutTemplate)
+class LayoutTemplateAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "created_at", "is_active")
+    readonly_fields = ("version", "content", "created_at")
+
+    def has_add_permission(self, request):
+        # Layouts are only created by generation
+        return False
+
+    def is_active(self, obj):
+        return SiteSettings.get_settings().active_layout_id == obj.id
+
+    is_active.boolean = True
+    is_active.short_description = "Active"
+
+    actions = ["activate_layout_action"]
+
+    def activate_layout_action(self, request, queryset):
+        """Make the selected layout version the active one."""
+        if queryset.count() != 1:
+            self.message_user(
+                request,
+                "Please select exactly one layout template.",
+                level=messages.ERROR,
+            )
+            return
+
+        from .layouts import activate_layout
+
+        layout = queryset.first()
+        activate_layout(layout)
+        self.message_user(
+            request,
+            f"{layout} is now the active layout template.",
+            level=messages.SUCCESS,
+        )
+
+    activate_layout_action.short_description = "Activate selected layout template"
+
+
+class GenerationStatusFilter(admin.SimpleListFilter):
+    """Filter pages by generation status, showing how many are in each."""
+
+    title = "generation status"
+    parameter_name = "generation_status"
+
+    def lookups(self, request, model_admin):
+        # One grouped count, answered from the status index
+        counts = dict(
+            Page.objects.order_by()
+            .values_list("generation_status")
+            .annotate(count=Count("id"))
+        )
+        return [
+            (status, f"{label} ({counts.get(status, 0)})")
+            for status, label in Page.PageStatus.choices
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(generation_status=self.value())
+        return queryset
+
+
+class PageAdminForm(forms.ModelForm):
+    regenerate = forms.BooleanField(
+        required=False,
+        label="Regenerate content",
+        help_text="Generate new content on save even if the title, description, "
+        "prompt, layout and site settings are unchanged",
+    )
+
+    class Meta:
+        model = Page
+        fields = "__all__"
+        # Sent back with the form, so saving can check the page is unchanged
+        widgets = {"version": forms.HiddenInput}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get("version")
+        if (
+            self.instance.pk
+            and version is not None
+            and Page.objects.filter(pk=self.instance.pk)
+            .exclude(version=version)
+            .exists()
+        ):
+            raise forms.ValidationError(
+                "This page was changed, for example by a content generation, "
+                "after you opened it. Reload it and make your changes again."
+            )
+        return cleaned_data
+
 
 @admin.register(Page)
 class PageAdmin(admin.ModelAdmin):
+    form = PageAdminForm
     list_display = (
         "title",
         "slug",
@@ -98,20 +220,97 @@ class PageAdmin(admin.ModelAdmin):
         "generation_status",
         "preview_link",
     )
-    list_filter = ("is_published", "created_at", "updated_at")
-    search_fields = ("title", "description", "content")
+    list_filter = (
+        GenerationStatusFilter,
+        "is_published",
+        "created_at",
+        "updated_at",
+    )
+    # Facets would count every page once per filter; the status filter shows
+    # its own counts
+    show_facets = admin.ShowFacets.NEVER
+    # Counting every page for "N total" is a full scan on large sites
+    show_full_result_count = False
+    changelist_deferred_fields = (
+        "description",
+        "content",
+        "fragment",
+        "partial_content",
+        "generation_error",
+        "ai_prompt",
+        "search_vector",
+    )
+    # Searched with LIKE only where full-text search isn't available
+    search_fields = ("title", "slug", "description")
     prepopulated_fields = {"slug": ("title",)}
-    readonly_fields = ("created_at", "updated_at")
+    readonly_fields = (
+        "created_at",
+        "updated_at",
+        "generation_status",
+        "generation_error",
+        "generation_task_id",
+    )
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The list only shows a few short columns, so don't load page bodies
+        match = request.resolver_match
+        if match is not None and match.url_name == "pages_page_changelist":
+            queryset = queryset.defer(*self.changelist_deferred_fields)
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search the full-text index on PostgreSQL, ranking the matches."""
+        if not search_term or connection.vendor != "postgresql":
+            return super().get_search_results(request, queryset, search_term)
+
+        query = SearchQuery(search_term, config="english", search_type="websearch")
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        )
+        # Show the best matches first unless another ordering was picked
+        if ORDER_VAR not in request.GET:
+            queryset = queryset.order_by("-search_rank", "-pk")
+        return queryset, False
 
     def save_model(self, request, obj, form, change):
         """Override save_model to generate content when saving a page."""
         # First save the model to ensure it has an ID
         super().save_model(request, obj, form, change)
 
+        # Drop the snapshot published under the previous slug
+        if change and "slug" in form.changed_data:
+            from .snapshots import delete_snapshot
+
+            delete_snapshot(form.initial["slug"])
+
+        # Skip the generation when nothing it depends on changed
+        if (
+            change
+            and not form.cleaned_data.get("regenerate")
+            and obj.generation_status == Page.PageStatus.COMPLETED
+            and obj.generation_fingerprint
+            == AIPageGenerator().get_input_fingerprint(obj)
+        ):
+            self.message_user(
+                request,
+                f"Page '{obj.title}' saved. Its generation inputs are unchanged, "
+                f"so the content was not regenerated.",
+                level=messages.SUCCESS,
+            )
+            return
+
         # Generate content for the page in the background
         from .utils import generate_page_in_background
 
-        success, message = generate_page_in_background(obj.id, AIPageGenerator)
+        # A forced regeneration must not get the cached completion back
+        success, message = generate_page_in_background(
+            obj.id,
+            AIPageGenerator,
+            regenerate=True,
+            use_cache=not form.cleaned_data.get("regenerate"),
+            lane=ADMIN,
+        )
 
         if success:
             self.message_user(
@@ -119,6 +318,14 @@ class PageAdmin(admin.ModelAdmin):
                 f"Page '{obj.title}' saved. Content generation started in the background.",
                 level=messages.SUCCESS,
             )
+        elif Page.objects.filter(id=obj.id).generating().exists():
+            # A running generation starts over when it sees the page changed
+            self.message_user(
+                request,
+                f"Page '{obj.title}' saved. Its content is already being generated "
+                f"and the generation will use the new inputs.",
+                level=messages.WARNING,
+            )
         else:
             self.message_user(
                 request,
@@ -136,12 +343,15 @@ class PageAdmin(admin.ModelAdmin):
             {
                 "fields": (
                     "ai_prompt",
+                    "regenerate",
                     "generation_status",
                     "generation_error",
+                    "generation_task_id",
                 )
             },
         ),
-        ("Content", {"fields": ("content",)}),
+        # The version is a hidden field, checked when the page is saved
+        ("Content", {"fields": ("content", "fragment", "version")}),
         (
             "Timestamps",
             {"fields": ("created_at", "updated_at"), "classes": ("collapse",)},
@@ -161,18 +371,41 @@ class PageAdmin(admin.ModelAdmin):
 
     generate_content.short_description = "Generate Content"
 
-    actions = ["generate_content_action"]
+    actions = ["generate_content_action", "regenerate_without_cache_action"]
 
-    def generate_content_action(self, request, queryset):
+    def changelist_view(self, request, extra_context=None):
+        from .lanes import get_lane_stats
+
+        extra_context = extra_context or {}
+        extra_context["lane_stats"] = get_lane_stats()
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def generate_content_action(self, request, queryset, use_cache=True):
         """Generate content for selected pages using the AI service in the background."""
-        from .utils import generate_page_in_background
+        from .utils import generate_page_in_background, generate_pages_in_background
+
+        # Several pages are generated in batches rather than one task per page
+        if queryset.count() > 1:
+            success, message = generate_pages_in_background(
+                queryset.values_list("id", flat=True), use_cache=use_cache
+            )
+            self.message_user(
+                request, message, level=messages.SUCCESS if success else messages.ERROR
+            )
+            return
 
         success_count = 0
         error_count = 0
         error_messages = []
 
         for page in queryset:
-            success, message = generate_page_in_background(page.id, AIPageGenerator)
+            success, message = generate_page_in_background(
+                page.id,
+                AIPageGenerator,
+                regenerate=True,
+                use_cache=use_cache,
+                lane=ADMIN,
+            )
             if success:
                 success_count += 1
             else:
@@ -193,3 +426,209 @@ class PageAdmin(admin.ModelAdmin):
                 self.message_user(request, error, level=messages.ERROR)
 
     generate_content_action.short_description = "Generate content using AI (background)"
+
+    def regenerate_without_cache_action(self, request, queryset):
+        """Generate fresh content for selected pages, ignoring cached LLM responses."""
+        self.generate_content_action(request, queryset, use_cache=False)
+
+    regenerate_without_cache_action.short_description = (
+        "Generate content using AI, bypassing the response cache (background)"
+    )
+
+
+@admin.register(CompletionCacheEntry)
+class CompletionCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "model", "size", "hits", "created_at", "last_used_at")
+    list_filter = ("model",)
+    readonly_fields = (
+        "key",
+        "model",
+        "content",
+        "size",
+        "hits",
+        "created_at",
+        "last_used_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from .completions import get_completion_cache_stats
+
+        extra_context = extra_context or {}
+        extra_context["cache_stats"] = get_completion_cache_stats()
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(SiteRebuild)
+class SiteRebuildAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "status",
+        "progress",
+        "succeeded",
+        "failed",
+        "skipped",
+        "waves",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    fields = (
+        "status",
+        "reason",
+        "wave_size",
+        "error_budget",
+        "total",
+        "succeeded",
+        "failed",
+        "skipped",
+        "waves",
+        "created_at",
+        "updated_at",
+        "finished_at",
+    )
+    readonly_fields = (
+        "status",
+        "reason",
+        "total",
+        "succeeded",
+        "failed",
+        "skipped",
+        "waves",
+        "created_at",
+        "updated_at",
+        "finished_at",
+    )
+
+    def has_add_permission(self, request):
+        # Rebuilds are started from the site settings
+        return False
+
+    def progress(self, obj):
+        return f"{obj.done} / {obj.total}"
+
+    actions = ["pause_action", "resume_action", "cancel_action"]
+
+    def pause_action(self, request, queryset):
+        """Stop the selected rebuilds after their current wave."""
+        from .rebuilds import pause_site_rebuild
+
+        paused = sum(pause_site_rebuild(rebuild.id) for rebuild in queryset)
+        self.message_user(request, f"Paused {paused} site rebuild(s).")
+
+    pause_action.short_description = "Pause selected site rebuilds"
+
+    def resume_action(self, request, queryset):
+        """Continue the selected paused or failed rebuilds."""
+        from .rebuilds import resume_site_rebuild
+
+        for rebuild in queryset:
+            success, message = resume_site_rebuild(rebuild.id)
+            self.message_user(
+                request,
+                f"{rebuild}: {message}",
+                level=messages.SUCCESS if success else messages.ERROR,
+            )
+
+    resume_action.short_description = "Resume selected site rebuilds"
+
+    def cancel_action(self, request, queryset):
+        """Stop the selected rebuilds for good after their current wave."""
+        from .rebuilds import cancel_site_rebuild
+
+        cancelled = sum(cancel_site_rebuild(rebuild.id) for rebuild in queryset)
+        self.message_user(request, f"Cancelled {cancelled} site rebuild(s).")
+
+    cancel_action.short_description = "Cancel selected site rebuilds"
+
+
+@admin.register(SiteRebuildItem)
+class SiteRebuildItemAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "page", "priority", "status", "error", "updated_at")
+    list_filter = ("status", "rebuild")
+    list_select_related = ("rebuild", "page")
+    readonly_fields = ("rebuild", "page", "priority", "status", "error", "updated_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
+class GenerationPeriodFilter(admin.SimpleListFilter):
+    """Limit the generation runs to a recent period, the last day by default."""
+
+    title = "period"
+    parameter_name = "period"
+
+    def lookups(self, request, model_admin):
+        from .telemetry import PERIODS
+
+        return [(key, label) for key, (label, _, _) in PERIODS.items()]
+
+    def value(self):
+        from .telemetry import DEFAULT_PERIOD, PERIODS
+
+        value = super().value()
+        return value if value in PERIODS else DEFAULT_PERIOD
+
+    def choices(self, changelist):
+        # There is always a period, so leave out the "All" choice
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == lookup,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: lookup}
+                ),
+                "display": title,
+            }
+
+    def queryset(self, request, queryset):
+        from .telemetry import PERIODS
+
+        _, span, _ = PERIODS[self.value()]
+        return queryset.filter(created_at__gte=timezone.now() - span)
+
+
+@admin.register(GenerationRun)
+class GenerationRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at",
+        "kind",
+        "page",
+        "lane",
+        "outcome",
+        "duration",
+        "time_to_first_token",
+        "queue_wait",
+        "prompt_tokens",
+        "completion_tokens",
+        "retries",
+    )
+    list_filter = (GenerationPeriodFilter, "kind", "outcome", "lane", "model")
+    list_select_related = ("page",)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        # Runs are records of what happened, so they can only be viewed
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from .telemetry import get_generation_stats
+
+        response = super().changelist_view(request, extra_context=extra_context)
+        changelist = getattr(response, "context_data", {}).get("cl")
+        if changelist is not None:
+            period = next(
+                spec.value()
+                for spec in changelist.filter_specs
+                if isinstance(spec, GenerationPeriodFilter)
+            )
+            # Summarise the runs matching the other filters too
+            response.context_data["generation_stats"] = get_generation_stats(
+                changelist.queryset, period
+            )
+        return response
@@ -0,0 +1,340 @@
+import json
+import logging
+import math
+import platform
+import random
+import threading
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .cache import invalidate_render, template_cache
+from .fakeai import FakeAIServer, render_fixture
+from .models import GenerationRun, LayoutTemplate, Page, SiteSettings
+from .services import AIPageGenerator
+
+logger = logging.getLogger(__name__)
+
+# Fixture pages and the admin user are recognisable by these names
+FIXTURE_PREFIX = "bench-"
+ADMIN_USERNAME = "bench-admin"
+
+FIXTURE_SIZES = {"small": 100, "medium": 10_000, "large": 100_000}
+FIXTURE_TOPICS = ("tea", "bikes", "books", "maps")
+
+
+def summarise(timings, elapsed) -> dict:
+    """Summarise timings in seconds as milliseconds and a throughput."""
+    timings = sorted(timings)
+
+    def percentile(p):
+        # Nearest-rank percentile
+        return timings[max(0, math.ceil(p / 100 * len(timings)) - 1)]
+
+    return {
+        "count": len(timings),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+        "per_second": round(len(timings) / elapsed, 2) if elapsed else None,
+    }
+
+
+def _measure(func, iterations, setup=None) -> dict:
+    """Time iterations of func, leaving the time spent in setup out."""
+    timings = []
+    for i in range(iterations):
+        if setup is not None:
+            setup(i)
+        started = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - started)
+    return summarise(timings, sum(timings))
+
+
+def create_fixture_pages(count) -> bool:
+    """
+    Create count published, generated pages to benchmark against.
+
+    Existing fixture pages are reused when there are exactly as many.
+    Returns whether the pages were created.
+    """
+    fixtures = Page.objects.filter(slug__startswith=FIXTURE_PREFIX)
+    if fixtures.count() == count:
+        return False
+    fixtures.delete()
+
+    fragment_mode = settings.AI_GENERATION_MODE == "fragment"
+    task = "Generate ONLY the <main> element" if fragment_mode else ""
+    bodies = [
+        render_fixture(f"Title: Benchmark page {i}\nDescription: d\n{task}", 600)
+        for i in range(20)
+    ]
+    batch = []
+    for i in range(count):
+        body = bodies[i % len(bodies)]
+        batch.append(
+            Page(
+                title=f"Benchmark page {i}",
+                slug=f"{FIXTURE_PREFIX}{i}",
+                description=f"A page about {FIXTURE_TOPICS[i % len(FIXTURE_TOPICS)]}.",
+                content="" if fragment_mode else body,
+                fragment=body if fragment_mode else "",
+                generation_status=Page.PageStatus.COMPLETED,
+                is_published=True,
+            )
+        )
+        if len(batch) == 1000:
+            Page.objects.bulk_create(batch)
+            batch = []
+    Page.objects.bulk_create(batch)
+    return True
+
+
+def delete_fixtures():
+    """Delete the fixture pages, their generation runs and the admin user."""
+    GenerationRun.objects.filter(page__slug__startswith=FIXTURE_PREFIX).delete()
+    Page.objects.filter(slug__startswith=FIXTURE_PREFIX).delete()
+    get_user_model().objects.filter(username=ADMIN_USERNAME).delete()
+
+
+def _admin_client() -> Client:
+    User = get_user_model()
+    user = User.objects.filter(username=ADMIN_USERNAME).first()
+    if user is None:
+        user = User(username=ADMIN_USERNAME, is_staff=True, is_superuser=True)
+        user.set_unusable_password()
+        user.save()
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    # Consume streamed responses, such as snapshots served as files
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def bench_render_page(pages, iterations) -> dict:
+    """Serve random pages with warm caches, as most visits are."""
+    client = Client()
+    rng = random.Random(0)
+    slugs = [rng.choice(pages)[1] for _ in range(iterations)]
+    for slug in set(slugs):
+        _get(client, f"/{slug}/")
+    return _measure(lambda i: _get(client, f"/{slugs[i]}/"), iterations)
+
+
+def bench_render_page_uncached(pages, iterations) -> dict:
+    """Serve random pages after dropping their cached templates and HTML."""
+    client = Client()
+    rng = random.Random(1)
+    sample = [rng.choice(pages) for _ in range(iterations)]
+
+    def setup(i):
+        template_cache.invalidate(sample[i][0])
+        invalidate_render(sample[i][0])
+
+    return _measure(lambda i: _get(client, f"/{sample[i][1]}/"), iterations, setup)
+
+
+def bench_admin_changelist(pages, iterations) -> dict:
+    """Load the first page of the admin page list."""
+    client = _admin_client()
+    _get(client, "/admin/pages/page/")
+    return _measure(lambda i: _get(client, "/admin/pages/page/"), iterations)
+
+
+def bench_admin_search(pages, iterations) -> dict:
+    """Search the admin page list for varying terms."""
+    client = _admin_client()
+    terms = [*FIXTURE_TOPICS, "benchmark page 7", "missing"]
+    return _measure(
+        lambda i: _get(client, f"/admin/pages/page/?q={terms[i % len(terms)]}"),
+        iterations,
+    )
+
+
+def bench_previous_page_examples(pages, iterations) -> dict:
+    """Load the example pages included in every generation prompt."""
+    generator = AIPageGenerator()
+    return _measure(
+        lambda i: generator._get_previous_page_examples(
+            exclude_page_id=pages[i % len(pages)][0]
+        ),
+        iterations,
+    )
+
+
+def bench_generate_page_content(pages, iterations) -> dict:
+    """Regenerate pages end to end through the task, against the AI server."""
+    from .tasks import generate_page_content
+
+    def setup(i):
+        Page.objects.filter(id=pages[i][0]).transition(
+            Page.PageStatus.PENDING, generation_task_id=""
+        )
+
+    def generate(i):
+        success, result = generate_page_content(pages[i][0], use_cache=False)
+        if not success:
+            raise RuntimeError(f"Generating page {pages[i][0]} failed: {result}")
+
+    # Leave generating a missing layout template out of the timings; it's
+    # removed again once the benchmarks are done
+    AIPageGenerator()._get_layout_template()
+    return _measure(generate, min(iterations, len(pages)), setup)
+
+
+BENCHMARKS = {
+    "render_page": bench_render_page,
+    "render_page_uncached": bench_render_page_uncached,
+    "admin_changelist": bench_admin_changelist,
+    "admin_search": bench_admin_search,
+    "previous_page_examples": bench_previous_page_examples,
+    "generate_page_content": bench_generate_page_content,
+}
+
+# Benchmarks doing an AI API call per iteration run fewer iterations
+GENERATION_BENCHMARKS = ("generate_page_content",)
+
+
+def _restore_layout(active_layout_id, latest_layout):
+    """Reactivate the previous layout and delete those generated since."""
+    site_settings = SiteSettings.objects.first()
+    if site_settings is not None and site_settings.active_layout_id != active_layout_id:
+        site_settings.active_layout_id = active_layout_id
+        site_settings.save(update_fields=["active_layout"])
+    LayoutTemplate.objects.filter(version__gt=latest_layout or 0).delete()
+
+
+def run_benchmarks(
+    names,
+    pages=100,
+    iterations=200,
+    generations=20,
+    ai_base_url=None,
+    ai_latency=0.05,
+    ai_tokens_per_second=5000.0,
+    log=None,
+) -> dict:
+    """
+    Run benchmarks against fixture pages and return the results.
+
+    Unless ai_base_url is given, generation runs against a local fake AI
+    server with a fixed latency and token rate, so the timings show the
+    pipeline's own overhead.
+    """
+    log = log or logger.info
+    started = time.perf_counter()
+    if create_fixture_pages(pages):
+        log(f"Created {pages} fixture pages in {time.perf_counter() - started:.1f}s")
+    fixtures = list(
+        Page.objects.filter(slug__startswith=FIXTURE_PREFIX)
+        .order_by("id")
+        .values_list("id", "slug")
+    )
+
+    server = None
+    if ai_base_url is None:
+        server = FakeAIServer(
+            ("127.0.0.1", 0),
+            latency=ai_latency,
+            latency_sigma=0,
+            tokens_per_second=ai_tokens_per_second,
+            token_rate_sigma=0,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        ai_base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # Layouts generated for the benchmarks are removed afterwards
+    active_layout_id = SiteSettings.get_settings().active_layout_id
+    latest_layout = LayoutTemplate.objects.aggregate(Max("version"))["version__max"]
+
+    results = {}
+    try:
+        # The completion cache isn't keyed on the API, so benchmark completions
+        # must not be stored alongside real ones
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            AI_BASE_URL=ai_base_url,
+            AI_API_KEY=settings.AI_API_KEY if server is None else "benchmark",
+            AI_RESPONSE_CACHE=False,
+        ):
+            for name in names:
+                count = generations if name in GENERATION_BENCHMARKS else iterations
+                results[name] = BENCHMARKS[name](fixtures, count)
+                log(
+                    f"{name}: p50 {results[name]['p50_ms']}ms, "
+                    f"p95 {results[name]['p95_ms']}ms"
+                )
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        _restore_layout(active_layout_id, latest_layout)
+        # Keep benchmark generations out of the telemetry, even when the
+        # fixtures are kept
+        GenerationRun.objects.filter(page__slug__startswith=FIXTURE_PREFIX).delete()
+
+    return {
+        "meta": {
+            "pages": pages,
+            "iterations": iterations,
+            "generations": generations,
+            "database": connection.vendor,
+            "cache": settings.CACHES["default"]["BACKEND"],
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "created_at": timezone.now().isoformat(),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare_results(results, baseline, threshold=20.0, min_delta_ms=1.0) -> list:
+    """
+    Compare results to a baseline run.
+
+    Returns a row per benchmark and statistic, flagging those more than
+    threshold percent and min_delta_ms milliseconds slower than the baseline.
+    The absolute floor keeps timer noise on fast paths from failing a run.
+    """
+    rows = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        for stat in ("p50_ms", "p95_ms"):
+            before, after = previous[stat], current[stat]
+            change = (after - before) / before * 100 if before else 0.0
+            rows.append(
+                {
+                    "benchmark": name,
+                    "stat": stat,
+                    "baseline": before,
+                    "current": after,
+                    "change": round(change, 1),
+                    "regression": change > threshold and after - before > min_delta_ms,
+                }
+            )
+    return rows
+
+
+def load_results(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Template
+
+SITE_SETTINGS_VERSION_KEY = "pages:site-settings-version"
+RENDER_CACHE_KEY = "pages:render:{page_id}"
+PAGE_VIEWS_KEY = "pages:views:{page_id}"
+GENERATION_STATUS_VERSION_KEY = "pages:generation-status-version"
+
+
+class TemplateCache:
+    """Bounded LRU cache of compiled page templates.
+
+    Entries are keyed by page id and a version, such as the page's
+    ``content_updated_at`` timestamp, so a saved or regenerated page never matches a
+    stale entry. Each page keeps at most one entry; older revisions are
+    replaced as soon as a newer one is compiled.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, page_id, version, get_source) -> Template:
+        """Return the compiled template for a page, compiling it on a miss."""
+        with self._lock:
+            entry = self._entries.get(page_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(page_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Compile outside the lock so a slow parse doesn't block other threads
+        template = Template(get_source())
+
+        with self._lock:
+            self._entries[page_id] = (version, template)
+            self._entries.move_to_end(page_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return template
+
+    def invalidate(self, page_id):
+        """Drop the cached template for a page, if any."""
+        with self._lock:
+            self._entries.pop(page_id, None)
+
+    def clear(self):
+        """Drop every cached template and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+template_cache = TemplateCache(
+    maxsize=getattr(settings, "PAGE_TEMPLATE_CACHE_SIZE", 256)
+)
+
+
+def get_site_settings_version() -> int:
+    """Return the current site settings version stamp from the shared cache."""
+    version = cache.get(SITE_SETTINGS_VERSION_KEY)
+    if version is None:
+        # Seed with a timestamp so a lost key never reuses an old version
+        cache.add(SITE_SETTINGS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(SITE_SETTINGS_VERSION_KEY)
+    return version
+
+
+def bump_site_settings_version():
+    """
+    Invalidate everything derived from the site settings in all processes.
+
+    The new version is the time of the change in nanoseconds, so it doubles
+    as the time the settings and the active layout were last modified.
+    """
+    version = max(time.time_ns(), (cache.get(SITE_SETTINGS_VERSION_KEY) or 0) + 1)
+    cache.set(SITE_SETTINGS_VERSION_KEY, version, timeout=None)
+
+
+def get_render_version(page) -> str:
+    """Return the version key for a page's rendered output."""
+    return (
+        f"{page.id}:{page.content_updated_at.isoformat()}:{get_site_settings_version()}"
+    )
+
+
+def get_generation_status_version() -> int:
+    """Return a stamp that changes whenever any page's generation status does."""
+    return cache.get(GENERATION_STATUS_VERSION_KEY, 0)
+
+
+def bump_generation_status_version():
+    """Wake up the status requests waiting for a generation status change."""
+    try:
+        cache.incr(GENERATION_STATUS_VERSION_KEY)
+    except ValueError:
+        cache.add(GENERATION_STATUS_VERSION_KEY, 1, timeout=None)
+
+
+def get_render_last_modified(page) -> int:
+    """
+    Return when a page's rendered output last changed, in seconds.
+
+    That's the later of its content change and the site settings change, so
+    a settings change also fails If-Modified-Since revalidations.
+    """
+    return int(
+        max(page.content_updated_at.timestamp(), get_site_settings_version() / 1e9)
+    )
+
+
+def get_render_etag(version) -> str:
+    """Return a strong ETag for a render version."""
+    return f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+
+
+def get_cached_render(page_id, version):
+    """Return the cached rendered HTML for a page if it matches the version."""
+    entry = cache.get(RENDER_CACHE_KEY.format(page_id=page_id))
+    if entry is not None and entry["version"] == version:
+        return entry["content"]
+    return None
+
+
+def set_cached_render(page_id, version, content):
+    """Store the rendered HTML for a page under its render version."""
+    cache.set(
+        RENDER_CACHE_KEY.format(page_id=page_id),
+        {"version": version, "content": content},
+        timeout=getattr(settings, "PAGE_RENDER_CACHE_TIMEOUT", 86400),
+    )
+
+
+def invalidate_render(page_id):
+    """Drop the cached rendered HTML for a page."""
+    cache.delete(RENDER_CACHE_KEY.format(page_id=page_id))
+
+
+def record_page_view(page_id):
+    """Count a page view, adding the counts to the page in batches."""
+    key = PAGE_VIEWS_KEY.format(page_id=page_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        views = cache.incr(key)
+    except ValueError:
+        return
+
+    if views >= getattr(settings, "PAGE_VIEW_FLUSH_THRESHOLD", 10):
+        from django.db.models import F
+
+        from .models import Page
+
+        # Take the buffered views first so concurrent views aren't added twice
+        cache.decr(key, views)
+        Page.objects.filter(id=page_id).update(view_count=F("view_count") + views)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Warning, register
+
+from .ratelimit import is_process_local
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when cache invalidation can't reach other processes."""
+    if settings.DEBUG or not is_process_local(caches["default"]):
+        return []
+    return [
+        Warning(
+            "The default cache is local to each process, so site settings and "
+            "rendered page invalidation won't reach other web or Django Q "
+            "workers.",
+            hint="Set CACHE_URL to a shared backend such as redis://.",
+            id="pages.W001",
+        )
+    ]
+
+
+@register()
+def check_rate_limit_cache(app_configs, **kwargs):
+    """Refuse to start when the AI rate limits can't be shared."""
+    if not settings.AI_RATE_LIMIT_RPM and not settings.AI_RATE_LIMIT_TPM:
+        return []
+    if not is_process_local(caches["default"]):
+        return []
+    return [
+        Error(
+            "AI_RATE_LIMIT_RPM and AI_RATE_LIMIT_TPM are shared through the "
+            "default cache, which is local to each process, so every web and "
+            "Django Q worker would get the full budget.",
+            hint="Set CACHE_URL to a shared backend such as redis://.",
+            id="pages.E001",
+        )
+    ]
@@ -0,0 +1,59 @@
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from openai import DefaultHttpxClient, OpenAI
+
+# Process-wide OpenAI clients, keyed by process id and endpoint
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_http_client() -> httpx.Client:
+    """Build a pooled HTTP client configured from the AI_HTTP_* settings."""
+    return DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.AI_HTTP_TIMEOUT, connect=settings.AI_HTTP_CONNECT_TIMEOUT
+        ),
+        http2=settings.AI_HTTP2 and _http2_available(),
+    )
+
+
+def get_openai_client() -> OpenAI:
+    """
+    Return the shared OpenAI client for this process.
+
+    The client and its connection pool are reused by every generation, so
+    connections stay alive between calls. Clients are keyed by process id so
+    one created before Django Q forks its workers is never shared with them.
+    """
+    key = (os.getpid(), settings.AI_BASE_URL, settings.AI_API_KEY)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    base_url=settings.AI_BASE_URL,
+                    api_key=settings.AI_API_KEY,
+                    http_client=_build_http_client(),
+                    # Retries go through AIPageGenerator and the shared rate limiter
+                    max_retries=0,
+                )
+                _clients[key] = client
+    return client
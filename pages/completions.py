@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import CompletionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def completion_cache_enabled() -> bool:
+    return getattr(settings, "AI_RESPONSE_CACHE", False)
+
+
+def get_completion_key(model, messages) -> str:
+    """Return the content address of a completion request."""
+    payload = json.dumps(
+        {"model": model, "messages": messages},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(seconds=settings.AI_RESPONSE_CACHE_TTL)
+
+
+def get_cached_completion(key):
+    """Return the cached completion for a key, or None on a miss."""
+    content = (
+        CompletionCacheEntry.objects.filter(key=key, created_at__gte=_expiry_cutoff())
+        .values_list("content", flat=True)
+        .first()
+    )
+    if content is None:
+        logger.info(f"Completion cache miss for {key[:12]}")
+        return None
+
+    CompletionCacheEntry.objects.filter(key=key).update(
+        hits=F("hits") + 1, last_used_at=timezone.now()
+    )
+    logger.info(f"Completion cache hit for {key[:12]}")
+    return content
+
+
+def store_completion(key, model, content):
+    """Cache a completion and evict expired or least recently used entries."""
+    CompletionCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={
+            "model": model,
+            "content": content,
+            "size": len(content.encode()),
+            "hits": 0,
+            "created_at": timezone.now(),
+            "last_used_at": timezone.now(),
+        },
+    )
+    prune_completion_cache()
+
+
+def prune_completion_cache() -> int:
+    """Evict entries past AI_RESPONSE_CACHE_TTL or beyond the size limits."""
+    deleted, _ = CompletionCacheEntry.objects.filter(
+        created_at__lt=_expiry_cutoff()
+    ).delete()
+
+    max_entries = settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+    max_bytes = settings.AI_RESPONSE_CACHE_MAX_BYTES
+    stats = CompletionCacheEntry.objects.aggregate(total_size=Sum("size"))
+    total_size = stats["total_size"] or 0
+    count = CompletionCacheEntry.objects.count()
+    if count <= max_entries and total_size <= max_bytes:
+        return deleted
+
+    # Walk entries from most to least recently used and drop whatever overflows
+    kept_size = 0
+    evict_ids = []
+    entries = CompletionCacheEntry.objects.order_by("-last_used_at").values_list(
+        "id", "size"
+    )
+    for position, (entry_id, size) in enumerate(entries.iterator()):
+        kept_size += size
+        if position >= max_entries or kept_size > max_bytes:
+            evict_ids.append(entry_id)
+
+    evicted, _ = CompletionCacheEntry.objects.filter(id__in=evict_ids).delete()
+    return deleted + evicted
+
+
+def get_completion_cache_stats() -> dict:
+    """Summarise how many paid calls the cache has saved."""
+    stats = CompletionCacheEntry.objects.aggregate(
+        hits=Sum("hits"), total_size=Sum("size")
+    )
+    entries = CompletionCacheEntry.objects.count()
+    hits = stats["hits"] or 0
+    # Every entry was created by one miss
+    requests = hits + entries
+    return {
+        "entries": entries,
+        "hits": hits,
+        "misses": entries,
+        "hit_ratio": hits / requests if requests else 0.0,
+        "total_size": stats["total_size"] or 0,
+    }
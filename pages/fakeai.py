@@ -0,0 +1,316 @@
+import hashlib
+import html
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .prompts import CHARS_PER_TOKEN, count_tokens
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "service quality customer team project solution design support experience "
+    "process value result approach partner growth plan detail craft local modern "
+    "reliable simple clear trusted expert community future practical careful "
+    "friendly flexible complete focused proven fast secure sustainable"
+).split()
+
+HEADINGS = (
+    "What we offer",
+    "How it works",
+    "Why choose us",
+    "Our approach",
+    "Frequently asked questions",
+    "Get in touch",
+)
+
+
+def _field(prompt, name, default=""):
+    """Return the value of a "Name: value" line of a prompt."""
+    match = re.search(rf"^\s*{re.escape(name)}:\s*(.+)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def _sentence(rng) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 16))
+    return " ".join(words).capitalize() + "."
+
+
+def _layout(prompt, main) -> str:
+    company = html.escape(_field(prompt, "Company Name", "Example Company"))
+    primary = re.search(r"Primary:\s*(#[0-9A-Fa-f]{3,6})", prompt)
+    font = html.escape(_field(prompt, "Font Family", "sans-serif"))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{company}</title>
+<style>
+body {{ font-family: {font}; margin: 0; }}
+header, footer {{ background: {primary.group(1) if primary else "#333333"}; color: #fff; padding: 1rem; }}
+main {{ max-width: 60rem; margin: 0 auto; padding: 1rem; }}
+</style>
+</head>
+<body>
+<header><nav aria-label="Main"><a href="/">{company}</a></nav></header>
+{main}
+<footer><p>&copy; {company}</p></footer>
+</body>
+</html>"""
+
+
+def render_fixture(prompt, tokens) -> str:
+    """
+    Build realistic HTML for a generation prompt.
+
+    Layout prompts get a layout template, page prompts a page or <main>
+    fragment about the page's title and description, of roughly the given
+    number of tokens. The same prompt always gets the same HTML.
+    """
+    rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+
+    if "Generate a base HTML layout" in prompt:
+        return _layout(prompt, "<main>\n<!-- page content -->\n</main>")
+
+    title = html.escape(_field(prompt, "Title", "Untitled"))
+    description = html.escape(_field(prompt, "Description"))
+    parts = [f'<main id="content">\n<h1>{title}</h1>', f"<p>{description}</p>"]
+    size = sum(len(part) for part in parts)
+    while size < tokens * CHARS_PER_TOKEN:
+        sentences = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        part = f"<section>\n<h2>{rng.choice(HEADINGS)}</h2>\n<p>{sentences}</p>\n</section>"
+        parts.append(part)
+        size += len(part)
+    main = "\n".join(parts) + "\n</main>"
+
+    if "Generate ONLY the <main> element" in prompt:
+        return main
+    return _layout(prompt, main)
+
+
+class FakeAIServer(ThreadingHTTPServer):
+    """
+    An OpenAI-compatible chat completions server returning generated HTML.
+
+    Latency to the first token and the token rate of each response are drawn
+    from log-normal distributions around the given medians. Failures are
+    injected at the given rates: 500 errors, 429 rate limit errors and
+    streams dropped halfway. The rpm and tpm limits answer with 429 and a
+    Retry-After header like the real API. Random draws come from one seeded
+    generator, so a run with the same requests in the same order behaves
+    the same.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency=0.5,
+        latency_sigma=0.5,
+        tokens_per_second=50.0,
+        token_rate_sigma=0.3,
+        response_tokens=600,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        disconnect_rate=0.0,
+        rpm=0,
+        tpm=0,
+        seed=0,
+    ):
+        super().__init__(address, FakeAIRequestHandler)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.token_rate_sigma = token_rate_sigma
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.disconnect_rate = disconnect_rate
+        self.rpm = rpm
+        self.tpm = tpm
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # (time, tokens) of the requests accepted in the last minute
+        self._window = deque()
+
+    def draw(self) -> dict:
+        """Draw the behaviour of the next request."""
+        with self._lock:
+            rng = self._rng
+            return {
+                "latency": self.latency * rng.lognormvariate(0, self.latency_sigma),
+                "rate": self.tokens_per_second
+                * rng.lognormvariate(0, self.token_rate_sigma),
+                "error": rng.random() < self.error_rate,
+                "rate_limited": rng.random() < self.rate_limit_rate,
+                "disconnect": rng.random() < self.disconnect_rate,
+            }
+
+    def admit(self, tokens):
+        """
+        Count a request against the rpm and tpm limits.
+
+        Returns None if it is admitted, otherwise the limit it exceeds and the
+        seconds until it would be admitted.
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 60:
+                self._window.popleft()
+
+            retry_after = 60 - (now - self._window[0][0]) if self._window else 0
+            if self.rpm and len(self._window) >= self.rpm:
+                return "requests", retry_after
+            used = sum(used for _, used in self._window)
+            if self.tpm and self._window and used + tokens > self.tpm:
+                return "tokens", retry_after
+
+            self._window.append((now, tokens))
+            return None
+
+
+class FakeAIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, type, headers=None):
+        self._send_json(
+            status,
+            {"error": {"message": message, "type": type, "code": type}},
+            headers,
+        )
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": []})
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_error(400, "Invalid JSON body", "invalid_request_error")
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+            return
+
+        server = self.server
+        model = request.get("model", "fake")
+        prompt = "\n".join(
+            message.get("content") or "" for message in request.get("messages", [])
+        )
+        prompt_tokens = count_tokens(prompt)
+        max_tokens = request.get("max_tokens") or request.get("max_completion_tokens")
+        tokens = min(server.response_tokens, max_tokens or server.response_tokens)
+        behaviour = server.draw()
+
+        limited = server.admit(prompt_tokens + tokens)
+        if limited or behaviour["rate_limited"]:
+            limit, retry_after = limited or ("requests", 1)
+            self._send_error(
+                429,
+                f"Rate limit reached for {limit} per minute.",
+                "rate_limit_exceeded",
+                {"Retry-After": f"{max(retry_after, 0.001):.3f}"},
+            )
+            return
+
+        time.sleep(behaviour["latency"])
+        if behaviour["error"]:
+            self._send_error(500, "The server had an error.", "server_error")
+            return
+
+        content = render_fixture(prompt, tokens)
+        completion_tokens = count_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": model,
+        }
+
+        try:
+            if request.get("stream"):
+                self._stream(request, completion, content, usage, behaviour)
+            else:
+                time.sleep(completion_tokens / behaviour["rate"])
+                self._send_json(
+                    200,
+                    {
+                        **completion,
+                        "object": "chat.completion",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": usage,
+                    },
+                )
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, for example after cancelling a generation
+            pass
+
+    def _stream(self, request, completion, content, usage, behaviour):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(choices, **extra):
+            chunk = {
+                **completion,
+                "object": "chat.completion.chunk",
+                "choices": choices,
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        # Stream a few tokens per chunk at the drawn token rate
+        step = 4 * CHARS_PER_TOKEN
+        delay = 4 / behaviour["rate"]
+        chunks = [content[i : i + step] for i in range(0, len(content), step)]
+        for i, text in enumerate(chunks):
+            if behaviour["disconnect"] and i >= len(chunks) // 2:
+                return
+            send([{"index": 0, "delta": {"content": text}, "finish_reason": None}])
+            time.sleep(delay)
+
+        send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
@@ -0,0 +1,91 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Generation lanes, highest priority first
+INTERACTIVE = "interactive"
+ADMIN = "admin"
+BULK = "bulk"
+LAYOUT = "layout"
+LANES = (INTERACTIVE, ADMIN, BULK, LAYOUT)
+
+LANE_STATS_KEY = "pages:lane:{lane}:{stat}"
+
+
+def get_lane_queue(lane):
+    """Return the Django Q queue for a lane, or None to use the main cluster."""
+    if not settings.AI_GENERATION_QUEUE:
+        return None
+    return f"{settings.AI_GENERATION_QUEUE}-{lane}"
+
+
+def get_queue_lane(queue):
+    """Return the lane a Django Q queue belongs to, if any."""
+    for lane in LANES:
+        if queue and queue == get_lane_queue(lane):
+            return lane
+    return None
+
+
+def get_lane_threads(threads) -> dict:
+    """
+    Return how many of a worker's threads each lane may use at most.
+
+    AI_LANE_SHARES gives each lane a percentage of the threads. Lanes without
+    a share may use all of them, so capping the low priority lanes keeps
+    threads free for visitors.
+    """
+    shares = settings.AI_LANE_SHARES
+    return {
+        lane: max(1, math.floor(threads * shares[lane] / 100))
+        if lane in shares
+        else threads
+        for lane in LANES
+    }
+
+
+def _incr(key, delta):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, timeout=None)
+
+
+def record_queue_wait(lane, seconds):
+    """Add the time a task spent queued to its lane's statistics."""
+    _incr(LANE_STATS_KEY.format(lane=lane, stat="tasks"), 1)
+    _incr(LANE_STATS_KEY.format(lane=lane, stat="wait_ms"), int(max(seconds, 0) * 1000))
+    cache.set(LANE_STATS_KEY.format(lane=lane, stat="last_wait"), seconds, None)
+
+
+def get_lane_stats() -> list:
+    """Summarise the queue depth and queue wait time of every lane."""
+    from django_q.brokers import get_broker
+
+    if not settings.AI_GENERATION_QUEUE:
+        return []
+
+    stats = []
+    for lane in LANES:
+        keys = {
+            stat: LANE_STATS_KEY.format(lane=lane, stat=stat)
+            for stat in ("tasks", "wait_ms", "last_wait")
+        }
+        values = cache.get_many(keys.values())
+        tasks = values.get(keys["tasks"], 0)
+        queue = get_lane_queue(lane)
+        stats.append(
+            {
+                "lane": lane,
+                "queue": queue,
+                "queued": get_broker(queue).queue_size(),
+                "tasks": tasks,
+                "average_wait": values.get(keys["wait_ms"], 0) / 1000 / tasks
+                if tasks
+                else 0.0,
+                "last_wait": values.get(keys["last_wait"]),
+            }
+        )
+    return stats
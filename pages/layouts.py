@@ -0,0 +1,93 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from .models import LayoutTemplate, SiteSettings
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_LOCK_KEY = "pages:layout-generation-lock"
+
+# Process-local cache of layout versions; rows are never modified once saved
+_layouts = {}
+_MAX_CACHED_LAYOUTS = 8
+
+
+def _get_layout(layout_id) -> LayoutTemplate:
+    layout = _layouts.get(layout_id)
+    if layout is None:
+        layout = LayoutTemplate.objects.get(id=layout_id)
+        if len(_layouts) >= _MAX_CACHED_LAYOUTS:
+            _layouts.clear()
+        _layouts[layout_id] = layout
+    return layout
+
+
+def get_active_layout():
+    """Return the active layout template, or None if there isn't one yet."""
+    layout_id = SiteSettings.get_settings().active_layout_id
+    if layout_id is None:
+        return None
+    try:
+        return _get_layout(layout_id)
+    except LayoutTemplate.DoesNotExist:
+        return None
+
+
+def create_layout(content, activate=True) -> LayoutTemplate:
+    """Store a new layout version, making it the active one by default."""
+    version = (
+        LayoutTemplate.objects.aggregate(Max("version"))["version__max"] or 0
+    ) + 1
+    layout = LayoutTemplate.objects.create(version=version, content=content)
+    if activate:
+        activate_layout(layout)
+    return layout
+
+
+def activate_layout(layout):
+    """Point the site settings at a layout version."""
+    site_settings = SiteSettings.objects.first() or SiteSettings.get_settings()
+    site_settings.active_layout = layout
+    site_settings.save(update_fields=["active_layout"])
+    logger.info(f"Activated layout template version {layout.version}")
+
+
+def get_or_generate_active_layout(generator):
+    """
+    Return the active layout, generating one if there is none.
+
+    Generation is single-flight: one caller holds a lock in the shared cache
+    while it calls the LLM, and concurrent callers wait for its result instead
+    of each generating and discarding a layout of their own.
+    """
+    layout = get_active_layout()
+    if layout is not None:
+        return layout
+
+    lock_timeout = settings.Q_CLUSTER["timeout"]
+    if cache.add(LAYOUT_LOCK_KEY, True, timeout=lock_timeout):
+        try:
+            # Another caller may have finished while we were acquiring the lock
+            layout = get_active_layout()
+            if layout is None:
+                success, result = generator.generate_layout_template()
+                if not success:
+                    logger.error(f"Error generating layout template: {result}")
+                    return None
+                layout = create_layout(result)
+            return layout
+        finally:
+            cache.delete(LAYOUT_LOCK_KEY)
+
+    # Wait for the caller holding the lock to store its layout
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(2)
+        layout = get_active_layout()
+        if layout is not None or cache.get(LAYOUT_LOCK_KEY) is None:
+            return layout
+    return None
@@ -0,0 +1,145 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.benchmarks import (
+    BENCHMARKS,
+    FIXTURE_SIZES,
+    compare_results,
+    delete_fixtures,
+    load_results,
+    run_benchmarks,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark page rendering, generation and the admin against fixture "
+        "pages. Writes to the configured database, so run it against a "
+        "development or CI database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            choices=FIXTURE_SIZES,
+            default="small",
+            help="Number of fixture pages: "
+            + ", ".join(f"{name}={count}" for name, count in FIXTURE_SIZES.items()),
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            choices=BENCHMARKS,
+            help="Benchmark to run, may be repeated (default: all)",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+            help="Iterations of each benchmark (default: 200)",
+        )
+        parser.add_argument(
+            "--generations",
+            type=int,
+            default=20,
+            help="Pages generated by the generation benchmark (default: 20)",
+        )
+        parser.add_argument(
+            "--ai-base-url",
+            help="AI API to generate with instead of the local fake server",
+        )
+        parser.add_argument(
+            "--ai-latency",
+            type=float,
+            default=0.05,
+            help="Seconds before the fake server's first token (default: 0.05)",
+        )
+        parser.add_argument(
+            "--ai-tokens-per-second",
+            type=float,
+            default=5000.0,
+            help="Token rate of the fake server (default: 5000)",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument(
+            "--baseline", help="Compare the results to this JSON results file"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=20.0,
+            help="Percent slowdown against the baseline that fails the run "
+            "(default: 20)",
+        )
+        parser.add_argument(
+            "--min-delta",
+            type=float,
+            default=1.0,
+            help="Milliseconds a statistic must also slow down by to fail the run "
+            "(default: 1.0)",
+        )
+        parser.add_argument(
+            "--keep-fixtures",
+            action="store_true",
+            help="Keep the fixture pages for the next run",
+        )
+
+    def handle(self, *args, **options):
+        baseline = load_results(options["baseline"]) if options["baseline"] else None
+        pages = FIXTURE_SIZES[options["size"]]
+
+        try:
+            results = run_benchmarks(
+                options["only"] or list(BENCHMARKS),
+                pages=pages,
+                iterations=options["iterations"],
+                generations=options["generations"],
+                ai_base_url=options["ai_base_url"],
+                ai_latency=options["ai_latency"],
+                ai_tokens_per_second=options["ai_tokens_per_second"],
+                log=self.stdout.write,
+            )
+        finally:
+            if not options["keep_fixtures"]:
+                delete_fixtures()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote the results to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if baseline is None:
+            return
+
+        meta, baseline_meta = results["meta"], baseline.get("meta", {})
+        for key in ("pages", "database"):
+            if meta[key] != baseline_meta.get(key):
+                self.stderr.write(
+                    f"The baseline was run with {key}={baseline_meta.get(key)}, "
+                    f"not {meta[key]}; the comparison may be misleading."
+                )
+
+        rows = compare_results(
+            results, baseline, options["threshold"], options["min_delta"]
+        )
+        for row in rows:
+            line = (
+                f"{row['benchmark']} {row['stat']}: {row['baseline']} -> "
+                f"{row['current']} ({row['change']:+}%)"
+            )
+            if row["regression"]:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} statistic(s) regressed by more than "
+                f"{options['threshold']}% and {options['min_delta']}ms against the "
+                "baseline."
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
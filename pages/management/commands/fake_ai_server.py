@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand
+
+from pages.fakeai import FakeAIServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI-compatible server returning generated HTML, for "
+        "testing and load testing page generation offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+        parser.add_argument("--port", type=int, default=8001, help="Port to bind")
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.5,
+            help="Median seconds before the first token (default: 0.5)",
+        )
+        parser.add_argument(
+            "--latency-sigma",
+            type=float,
+            default=0.5,
+            help="Spread of the log-normal latency distribution (default: 0.5)",
+        )
+        parser.add_argument(
+            "--tokens-per-second",
+            type=float,
+            default=50.0,
+            help="Median tokens generated per second (default: 50)",
+        )
+        parser.add_argument(
+            "--token-rate-sigma",
+            type=float,
+            default=0.3,
+            help="Spread of the log-normal token rate distribution (default: 0.3)",
+        )
+        parser.add_argument(
+            "--response-tokens",
+            type=int,
+            default=600,
+            help="Approximate tokens in each generated page (default: 600)",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests failing with a 500 error (default: 0)",
+        )
+        parser.add_argument(
+            "--rate-limit-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests failing with a 429 error (default: 0)",
+        )
+        parser.add_argument(
+            "--disconnect-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of streams dropped halfway (default: 0)",
+        )
+        parser.add_argument(
+            "--rpm",
+            type=int,
+            default=0,
+            help="Requests per minute before answering 429, 0 for no limit",
+        )
+        parser.add_argument(
+            "--tpm",
+            type=int,
+            default=0,
+            help="Tokens per minute before answering 429, 0 for no limit",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the random draws"
+        )
+
+    def handle(self, *args, **options):
+        server = FakeAIServer(
+            (options["host"], options["port"]),
+            latency=options["latency"],
+            latency_sigma=options["latency_sigma"],
+            tokens_per_second=options["tokens_per_second"],
+            token_rate_sigma=options["token_rate_sigma"],
+            response_tokens=options["response_tokens"],
+            error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"],
+            disconnect_rate=options["disconnect_rate"],
+            rpm=options["rpm"],
+            tpm=options["tpm"],
+            seed=options["seed"],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Fake AI server listening on http://{host}:{port}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
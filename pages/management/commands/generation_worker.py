@@ -0,0 +1,62 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.lanes import LANES, get_lane_queue, get_lane_threads
+from pages.worker import ThreadedWorker
+
+
+class Command(BaseCommand):
+    help = "Run generation tasks from the priority lane queues concurrently in threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.AI_WORKER_THREADS,
+            help="Number of tasks to run at once "
+            f"(default: {settings.AI_WORKER_THREADS})",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=settings.AI_WORKER_TIMEOUT,
+            help="Seconds a task may run before it is cancelled "
+            f"(default: {settings.AI_WORKER_TIMEOUT})",
+        )
+        parser.add_argument(
+            "--lanes",
+            default=",".join(LANES),
+            help="Comma-separated lanes to work on, highest priority first "
+            f"(default: {','.join(LANES)})",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.AI_GENERATION_QUEUE:
+            raise CommandError(
+                "No generation queue is configured. Set AI_GENERATION_QUEUE to "
+                "route generation tasks to this worker."
+            )
+
+        lanes = [lane.strip() for lane in options["lanes"].split(",") if lane.strip()]
+        unknown = set(lanes) - set(LANES)
+        if unknown:
+            raise CommandError(f"Unknown lane(s): {', '.join(sorted(unknown))}")
+
+        lane_threads = get_lane_threads(options["threads"])
+        worker = ThreadedWorker(
+            [(lane, get_lane_queue(lane), lane_threads[lane]) for lane in lanes],
+            threads=options["threads"],
+            timeout=options["timeout"],
+        )
+        signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+        signal.signal(signal.SIGINT, lambda *args: worker.stop())
+
+        stuck = worker.run()
+        if stuck:
+            # Threads can't be killed, so exit without waiting for them
+            self.stderr.write(f"Exiting with {stuck} stuck task(s).")
+            os._exit(1)
+        self.stdout.write(self.style.SUCCESS("Generation worker stopped."))
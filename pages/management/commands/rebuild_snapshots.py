@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.snapshots import rebuild_snapshots, snapshots_enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuild the static HTML snapshots of all published pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of snapshots to render in parallel (default: 4)",
+        )
+
+    def handle(self, *args, **options):
+        if not snapshots_enabled():
+            raise CommandError(
+                "Page snapshots are disabled. Set PAGE_SNAPSHOT_MODE to enable them."
+            )
+
+        written, failed, removed = rebuild_snapshots(workers=options["workers"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} snapshot(s), removed {removed} stale snapshot(s)."
+            )
+        )
+        if failed:
+            raise CommandError(f"Failed to write {failed} snapshot(s).")
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0003_page_generation_error_page_generation_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="generation_task_id",
+            field=models.CharField(
+                blank=True,
+                help_text="Django Q task id of the latest generation",
+                max_length=32,
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0004_page_generation_task_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="partial_content",
+            field=models.TextField(
+                blank=True,
+                help_text="Content received so far while generation is in progress",
+            ),
+        ),
+    ]
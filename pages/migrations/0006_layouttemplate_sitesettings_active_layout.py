@@ -0,0 +1,68 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:51
+
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def import_layout_file(apps, schema_editor):
+    """Store the layout previously generated to disk as the first version."""
+    LayoutTemplate = apps.get_model("pages", "LayoutTemplate")
+    SiteSettings = apps.get_model("pages", "SiteSettings")
+
+    template_path = os.path.join(
+        settings.BASE_DIR, "pages", "templates", "pages", "generated_layout.html"
+    )
+    if not os.path.exists(template_path):
+        return
+
+    with open(template_path, "r") as f:
+        layout = LayoutTemplate.objects.create(version=1, content=f.read())
+    SiteSettings.objects.filter(active_layout__isnull=True).update(active_layout=layout)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0005_page_partial_content"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LayoutTemplate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(unique=True)),
+                (
+                    "content",
+                    models.TextField(help_text="HTML layout shared by all pages"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-version"],
+            },
+        ),
+        migrations.AddField(
+            model_name="sitesettings",
+            name="active_layout",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Layout template used when generating pages",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="pages.layouttemplate",
+            ),
+        ),
+        migrations.RunPython(import_layout_file, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0006_layouttemplate_sitesettings_active_layout"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompletionCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="SHA-256 of the model name and the assembled messages",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                ("model", models.CharField(max_length=100)),
+                ("content", models.TextField()),
+                (
+                    "size",
+                    models.PositiveIntegerField(
+                        help_text="Size of the content in bytes"
+                    ),
+                ),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Completion cache entry",
+                "verbose_name_plural": "Completion cache entries",
+                "ordering": ["-last_used_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0007_completioncacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="fragment",
+            field=models.TextField(
+                blank=True,
+                help_text="AI-generated <main> element, composed into the active layout when rendered",
+            ),
+        ),
+    ]
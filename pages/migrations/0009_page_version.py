@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0008_page_fragment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Incremented on every write, to detect concurrent changes",
+            ),
+        ),
+    ]
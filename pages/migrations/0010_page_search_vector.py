@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:05
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Title and description rank above the text of the generated HTML, which has
+# its scripts, styles and tags stripped
+CREATE_SEARCH_TRIGGER = [
+    r"""
+    CREATE FUNCTION pages_page_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B') ||
+            setweight(to_tsvector('english', regexp_replace(
+                regexp_replace(
+                    coalesce(nullif(NEW.fragment, ''), NEW.content, ''),
+                    '<(script|style)[^>]*?>.*?</\1>', ' ', 'gi'
+                ),
+                '<[^>]*>', ' ', 'g'
+            )), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER pages_page_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, content, fragment
+    ON pages_page FOR EACH ROW EXECUTE FUNCTION pages_page_search_vector_update()
+    """,
+    "CREATE INDEX pages_page_search_vector_gin ON pages_page USING gin (search_vector)",
+    # Fill in the vector of the existing pages
+    "UPDATE pages_page SET title = title",
+]
+
+DROP_SEARCH_TRIGGER = [
+    "DROP INDEX IF EXISTS pages_page_search_vector_gin",
+    "DROP TRIGGER IF EXISTS pages_page_search_vector_trigger ON pages_page",
+    "DROP FUNCTION IF EXISTS pages_page_search_vector_update()",
+]
+
+
+def create_search_trigger(apps, schema_editor):
+    """Maintain the search vector in the database, which only PostgreSQL can."""
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in CREATE_SEARCH_TRIGGER:
+            schema_editor.execute(sql)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in DROP_SEARCH_TRIGGER:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0009_page_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False,
+                help_text="Weighted title, description and text of the content, kept up to date by a database trigger on PostgreSQL",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
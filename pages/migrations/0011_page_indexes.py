@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0010_page_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(fields=["-updated_at"], name="page_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(
+                fields=["generation_status", "-updated_at"],
+                name="page_status_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(
+                fields=["is_published", "-updated_at"],
+                name="page_published_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(fields=["-created_at"], name="page_created_idx"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_updated_at(apps, schema_editor):
+    """Keep the render versions and ETags of existing pages unchanged."""
+    Page = apps.get_model("pages", "Page")
+    Page.objects.update(content_updated_at=models.F("updated_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0011_page_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="content_updated_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="When the live content or the page details last changed",
+            ),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0012_page_content_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="generation_fingerprint",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the inputs of the latest successful generation",
+                max_length=64,
+            ),
+        ),
+    ]
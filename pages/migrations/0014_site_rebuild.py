@@ -0,0 +1,142 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0013_page_generation_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SiteRebuild",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("paused", "Paused"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("reason", models.CharField(blank=True, max_length=255)),
+                (
+                    "wave_size",
+                    models.PositiveIntegerField(
+                        help_text="Number of pages regenerated at a time"
+                    ),
+                ),
+                (
+                    "error_budget",
+                    models.PositiveIntegerField(
+                        help_text="Failed pages after which the rebuild stops"
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("succeeded", models.PositiveIntegerField(default=0)),
+                ("failed", models.PositiveIntegerField(default=0)),
+                ("skipped", models.PositiveIntegerField(default=0)),
+                ("waves", models.PositiveIntegerField(default=0)),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Until when the task running the current wave holds the rebuild",
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="view_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Approximate number of times the page was rendered by Django",
+            ),
+        ),
+        migrations.CreateModel(
+            name="SiteRebuildItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "priority",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Page views when the rebuild started"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                            ("skipped", "Skipped"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "page",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="pages.page",
+                    ),
+                ),
+                (
+                    "rebuild",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="pages.siterebuild",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-priority", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["rebuild", "status", "-priority"],
+                        name="rebuild_item_next_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0014_site_rebuild"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GenerationRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("page", "Page"), ("layout", "Layout template")],
+                        default="page",
+                        max_length=20,
+                    ),
+                ),
+                ("task_id", models.CharField(blank=True, max_length=32)),
+                ("lane", models.CharField(blank=True, max_length=20)),
+                ("model", models.CharField(max_length=100)),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[
+                            ("succeeded", "Succeeded"),
+                            ("failed", "Failed"),
+                            ("discarded", "Discarded"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                (
+                    "queue_wait",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Seconds the task waited in its queue",
+                        null=True,
+                    ),
+                ),
+                (
+                    "time_to_first_token",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Seconds until the AI API sent output",
+                        null=True,
+                    ),
+                ),
+                (
+                    "duration",
+                    models.FloatField(help_text="Seconds the generation took"),
+                ),
+                ("prompt_tokens", models.PositiveIntegerField(blank=True, null=True)),
+                ("cached_tokens", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "completion_tokens",
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                ("output_bytes", models.PositiveIntegerField(default=0)),
+                ("retries", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "cached_response",
+                    models.BooleanField(
+                        default=False, help_text="Whether the response cache answered"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                (
+                    "page",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="pages.page",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
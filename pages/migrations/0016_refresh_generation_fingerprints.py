@@ -0,0 +1,81 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import migrations
+
+# Site settings the fingerprints used to include, and the ones they include
+# now: only those in the page prompt
+OLD_SITE_FIELDS = (
+    "company_name",
+    "primary_color",
+    "secondary_color",
+    "accent_color",
+    "font_family",
+    "preferred_style",
+    "footer_text",
+    "contact_email",
+    "contact_phone",
+)
+SITE_FIELDS = (
+    "company_name",
+    "preferred_style",
+    "primary_color",
+    "secondary_color",
+    "accent_color",
+    "font_family",
+)
+
+
+def _hash(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def refresh_fingerprints(apps, schema_editor):
+    """Keep pages that were up to date from being seen as stale."""
+    Page = apps.get_model("pages", "Page")
+    SiteSettings = apps.get_model("pages", "SiteSettings")
+
+    site_settings = SiteSettings.objects.select_related("active_layout").first()
+    if site_settings is None:
+        return
+    layout = site_settings.active_layout
+    shared = {
+        "layout": layout.version if layout else None,
+        "model": settings.AI_API_MODEL,
+        "mode": settings.AI_GENERATION_MODE,
+    }
+    old_site = {field: getattr(site_settings, field) for field in OLD_SITE_FIELDS}
+    site_fingerprint = _hash(
+        {
+            **shared,
+            "site": {field: getattr(site_settings, field) for field in SITE_FIELDS},
+        }
+    )
+
+    pages = Page.objects.exclude(generation_fingerprint="").only(
+        "title", "description", "ai_prompt", "generation_fingerprint"
+    )
+    updated = []
+    for page in pages.iterator():
+        details = {
+            "title": page.title,
+            "description": page.description,
+            "ai_prompt": page.ai_prompt,
+        }
+        if page.generation_fingerprint == _hash(
+            {**details, **shared, "site": old_site}
+        ):
+            page.generation_fingerprint = _hash({**details, "site": site_fingerprint})
+            updated.append(page)
+    Page.objects.bulk_update(updated, ["generation_fingerprint"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("pages", "0015_generationrun"),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_fingerprints, migrations.RunPython.noop),
+    ]
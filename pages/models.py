@@ -1,4 +1,12 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import DatabaseError, models, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump_generation_status_version, get_site_settings_version
+
+# Process-local copy of the site settings as a (version, instance) pair
+_site_settings_cache = None
 
 
 class SiteSettings(models.Model):
@@ -40,6 +48,16 @@ class SiteSettings(models.Model):
     contact_email = models.EmailField(blank=True)
     contact_phone = models.CharField(max_length=20, blank=True)
 
+    # Layout shared by all generated pages
+    active_layout = models.ForeignKey(
+        "LayoutTemplate",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        help_text="Layout template used when generating pages",
+    )
+
     class Meta:
         verbose_name = "Site Settings"
         verbose_name_plural = "Site Settings"
@@ -49,13 +67,86 @@ class SiteSettings(models.Model):
 
     @classmethod
     def get_settings(cls):
-        """Get the site settings, creating default ones if none exist."""
+        """
+        Get the site settings, creating default ones if none exist.
+
+        The settings are cached in-process and only reloaded when the shared
+        site settings version changes, which happens on every save.
+        """
+        global _site_settings_cache
+
+        version = get_site_settings_version()
+        if _site_settings_cache is not None and _site_settings_cache[0] == version:
+            return _site_settings_cache[1]
+
         settings = cls.objects.first()
         if not settings:
-            settings = cls.objects.create(company_name="My Company")
+            # Layouts stored before the settings existed, such as the one
+            # imported by a migration, start out active
+            settings = cls.objects.create(
+                company_name="My Company",
+                active_layout=LayoutTemplate.objects.order_by("-version").first(),
+            )
+            version = get_site_settings_version()
+
+        _site_settings_cache = (version, settings)
         return settings
 
 
+class LayoutTemplate(models.Model):
+    """Model for storing generated versions of the site layout."""
+
+    version = models.PositiveIntegerField(unique=True)
+    content = models.TextField(help_text="HTML layout shared by all pages")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Layout v{self.version}"
+
+    class Meta:
+        ordering = ["-version"]
+
+
+class PageVersionConflict(DatabaseError):
+    """Raised when saving a page that was changed since it was loaded."""
+
+
+class PageQuerySet(models.QuerySet):
+    def with_content(self):
+        """Pages with generated output, either a full page or a fragment."""
+        return self.filter(~models.Q(content="") | ~models.Q(fragment=""))
+
+    def generating(self):
+        """Pages with a generation queued or running."""
+        return self.filter(
+            generation_status__in=[
+                Page.PageStatus.PENDING,
+                Page.PageStatus.IN_PROGRESS,
+            ]
+        )
+
+    def transition(self, status, **fields) -> int:
+        """
+        Move the matching pages to a generation status with a single UPDATE.
+
+        Only pages whose current status may move to ``status`` are updated.
+        Every transition bumps the page's version, so a caller can filter on
+        the version it read to detect concurrent changes. Returns the number
+        of pages updated.
+        """
+        updated = self.filter(
+            generation_status__in=self.model.GENERATION_TRANSITIONS[status]
+        ).update(
+            generation_status=status,
+            version=models.F("version") + 1,
+            updated_at=timezone.now(),
+            **fields,
+        )
+        if updated:
+            transaction.on_commit(bump_generation_status_version, using=self.db)
+        return updated
+
+
 class Page(models.Model):
     class PageStatus(models.TextChoices):
         """Enumeration for page generation status."""
@@ -66,6 +157,31 @@ class Page(models.Model):
         COMPLETED = "completed", "Completed"
         FAILED = "failed", "Failed"
 
+    # The statuses each generation status can be reached from
+    GENERATION_TRANSITIONS = {
+        PageStatus.NOT_STARTED: (),
+        PageStatus.PENDING: (
+            PageStatus.NOT_STARTED,
+            PageStatus.COMPLETED,
+            PageStatus.FAILED,
+            # A generation whose page was edited meanwhile starts over
+            PageStatus.IN_PROGRESS,
+        ),
+        PageStatus.IN_PROGRESS: (PageStatus.PENDING, PageStatus.IN_PROGRESS),
+        PageStatus.COMPLETED: (PageStatus.IN_PROGRESS,),
+        PageStatus.FAILED: (PageStatus.PENDING, PageStatus.IN_PROGRESS),
+    }
+
+    # Fields only written through transitions, never by a full save()
+    GENERATION_FIELDS = (
+        "generation_status",
+        "generation_error",
+        "generation_task_id",
+        "generation_fingerprint",
+        "partial_content",
+        "version",
+    )
+
     """Model for storing generated pages."""
     title = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
@@ -73,8 +189,20 @@ class Page(models.Model):
         help_text="Brief description of what this page should contain"
     )
     content = models.TextField(blank=True, help_text="AI-generated HTML content")
+    fragment = models.TextField(
+        blank=True,
+        help_text="AI-generated <main> element, composed into the active layout when rendered",
+    )
+    partial_content = models.TextField(
+        blank=True,
+        help_text="Content received so far while generation is in progress",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    content_updated_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="When the live content or the page details last changed",
+    )
     is_published = models.BooleanField(default=False)
     generation_status = models.CharField(
         max_length=20,
@@ -85,12 +213,253 @@ class Page(models.Model):
     generation_error = models.TextField(
         blank=True, help_text="Error message if generation failed"
     )
+    generation_task_id = models.CharField(
+        max_length=32,
+        blank=True,
+        help_text="Django Q task id of the latest generation",
+    )
+    view_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Approximate number of times the page was rendered by Django",
+    )
+    generation_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash of the inputs of the latest successful generation",
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text="Incremented on every write, to detect concurrent changes",
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Weighted title, description and text of the content, kept up "
+        "to date by a database trigger on PostgreSQL",
+    )
 
     # AI generation settings
     ai_prompt = models.TextField(help_text="The prompt used to generate this page")
 
+    objects = PageQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    def get_absolute_url(self):
+        return reverse("render_page", kwargs={"slug": self.slug})
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        # Leave the generation state to transition(), so saving a page loaded
+        # before a generation started can't overwrite its progress
+        update_fields = kwargs.pop("update_fields", None)
+        if update_fields is None:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.GENERATION_FIELDS
+                # Maintained by the database and by buffered counters
+                and field.name not in ("search_vector", "view_count")
+            ]
+        # Only write over the version this instance was loaded with, so a
+        # stale copy can't overwrite newly generated content
+        self._expected_version = self.version
+        self.version = models.F("version") + 1
+        self.content_updated_at = timezone.now()
+        try:
+            # In a savepoint, so a caller's transaction survives a conflict
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(
+                    *args,
+                    update_fields={*update_fields, "version", "content_updated_at"},
+                    **kwargs,
+                )
+        except DatabaseError:
+            self.version = self._expected_version
+            if (
+                Page.objects.filter(pk=self.pk)
+                .exclude(version=self._expected_version)
+                .exists()
+            ):
+                raise PageVersionConflict(
+                    f"Page {self.pk} was changed since it was loaded."
+                ) from None
+            raise
+        finally:
+            self._expected_version = None
+        self.refresh_from_db(fields=["version"])
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = getattr(self, "_expected_version", None)
+        if expected_version is not None:
+            base_qs = base_qs.filter(version=expected_version)
+        return super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # The default ordering, alone and within the admin list filters
+            models.Index(fields=["-updated_at"], name="page_updated_idx"),
+            models.Index(
+                fields=["generation_status", "-updated_at"],
+                name="page_status_updated_idx",
+            ),
+            models.Index(
+                fields=["is_published", "-updated_at"],
+                name="page_published_updated_idx",
+            ),
+            # Recent pages used as examples when generating a page
+            models.Index(fields=["-created_at"], name="page_created_idx"),
+        ]
+
+
+class CompletionCacheEntry(models.Model):
+    """Model for caching LLM completions by a hash of their exact inputs."""
+
+    key = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the model name and the assembled messages",
+    )
+    model = models.CharField(max_length=100)
+    content = models.TextField()
+    size = models.PositiveIntegerField(help_text="Size of the content in bytes")
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}"
+
+    class Meta:
+        ordering = ["-last_used_at"]
+        verbose_name = "Completion cache entry"
+        verbose_name_plural = "Completion cache entries"
+
+
+class SiteRebuild(models.Model):
+    """A job regenerating, in waves, every page made with older inputs."""
+
+    class Status(models.TextChoices):
+        RUNNING = "running", "Running"
+        PAUSED = "paused", "Paused"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+        CANCELLED = "cancelled", "Cancelled"
+
+    status = models.CharField(max_length=20, choices=Status, default=Status.RUNNING)
+    reason = models.CharField(max_length=255, blank=True)
+    wave_size = models.PositiveIntegerField(
+        help_text="Number of pages regenerated at a time"
+    )
+    error_budget = models.PositiveIntegerField(
+        help_text="Failed pages after which the rebuild stops"
+    )
+    total = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    waves = models.PositiveIntegerField(default=0)
+    lease_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Until when the task running the current wave holds the rebuild",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Site rebuild #{self.id}"
+
+    @property
+    def done(self):
+        return self.succeeded + self.failed + self.skipped
+
+    class Meta:
+        ordering = ["-created_at"]
+
+
+class SiteRebuildItem(models.Model):
+    """A page to regenerate within a site rebuild, and where it stands."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+        SKIPPED = "skipped", "Skipped"
+
+    rebuild = models.ForeignKey(
+        SiteRebuild, on_delete=models.CASCADE, related_name="items"
+    )
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="+")
+    priority = models.PositiveIntegerField(
+        default=0, help_text="Page views when the rebuild started"
+    )
+    status = models.CharField(max_length=20, choices=Status, default=Status.PENDING)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.rebuild}: page {self.page_id}"
+
+    class Meta:
+        ordering = ["-priority", "id"]
+        indexes = [
+            models.Index(
+                fields=["rebuild", "status", "-priority"],
+                name="rebuild_item_next_idx",
+            ),
+        ]
+
+
+class GenerationRun(models.Model):
+    """Timings and usage of one attempt at generating a page or layout."""
+
+    class Kind(models.TextChoices):
+        PAGE = "page", "Page"
+        LAYOUT = "layout", "Layout template"
+
+    class Outcome(models.TextChoices):
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+        DISCARDED = "discarded", "Discarded"
+
+    kind = models.CharField(max_length=20, choices=Kind, default=Kind.PAGE)
+    page = models.ForeignKey(
+        Page, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    task_id = models.CharField(max_length=32, blank=True)
+    lane = models.CharField(max_length=20, blank=True)
+    model = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=20, choices=Outcome)
+    error = models.TextField(blank=True)
+    queue_wait = models.FloatField(
+        null=True, blank=True, help_text="Seconds the task waited in its queue"
+    )
+    time_to_first_token = models.FloatField(
+        null=True, blank=True, help_text="Seconds until the AI API sent output"
+    )
+    duration = models.FloatField(help_text="Seconds the generation took")
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_bytes = models.PositiveIntegerField(default=0)
+    retries = models.PositiveSmallIntegerField(default=0)
+    cached_response = models.BooleanField(
+        default=False, help_text="Whether the response cache answered"
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} generation #{self.id}"
+
+    class Meta:
+        ordering = ["-created_at"]
@@ -0,0 +1,99 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token, used when tiktoken isn't installed
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model):
+    """Return a tiktoken encoding for the model, or None if unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=None) -> int:
+    """Count the tokens in text, estimating when tiktoken isn't installed."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=None) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+class PromptAssembler:
+    """
+    Builds a prompt from titled sections within a token budget.
+
+    Sections are emitted in the order they are added, so static sections
+    should be added first to give providers a stable prefix to cache.
+    Required sections are always kept whole; optional sections are truncated,
+    in order, to whatever budget the required ones leave.
+    """
+
+    def __init__(self, budget, model=None, preamble=""):
+        self.budget = budget
+        self.model = model
+        self.preamble = preamble
+        self.sections = []
+        self.token_counts = {}
+
+    def add(self, title, text, required=True):
+        self.sections.append((title, text.strip(), required))
+        return self
+
+    def _format(self, title, text) -> str:
+        return f"=== {title} ===\n{text}\n"
+
+    def build(self) -> str:
+        """Assemble the prompt, recording the token count of each section."""
+        used = count_tokens(self.preamble, self.model)
+        for title, text, required in self.sections:
+            if required:
+                used += count_tokens(self._format(title, text), self.model)
+
+        if used > self.budget:
+            logger.warning(
+                f"Required prompt sections use {used} tokens, "
+                f"over the budget of {self.budget}"
+            )
+
+        remaining = self.budget - used
+        parts = [self.preamble] if self.preamble else []
+        self.token_counts = {}
+        for title, text, required in self.sections:
+            if not required:
+                header_tokens = count_tokens(self._format(title, ""), self.model)
+                text = truncate_to_tokens(text, remaining - header_tokens, self.model)
+                if not text:
+                    self.token_counts[title] = 0
+                    continue
+
+            section = self._format(title, text)
+            tokens = count_tokens(section, self.model)
+            if not required:
+                remaining -= tokens
+            self.token_counts[title] = tokens
+            parts.append(section)
+
+        return "\n".join(parts)
@@ -0,0 +1,204 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import openai
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = "pages:ratelimit:bucket"
+RATE_LIMIT_LOCK_KEY = "pages:ratelimit:lock"
+LOCK_TIMEOUT = 5
+
+
+class IncompleteStreamError(Exception):
+    """Raised when a completion stream ends without a finish reason."""
+
+
+def is_process_local(backend) -> bool:
+    """Whether a cache backend is private to each process."""
+    return isinstance(backend, (LocMemCache, DummyCache))
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets shared by every
+    process.
+
+    Each bucket holds up to a minute's worth of its limit and refills
+    continuously at that rate. The buckets live in the shared cache and are
+    updated under a cache lock, so all web and Django Q workers draw from the
+    same budget. A limit of 0 disables it.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, backend=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.cache = backend or cache
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    @contextmanager
+    def _lock(self):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        # The lock expires on its own if its holder dies
+        while not self.cache.add(RATE_LIMIT_LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                # Assume the holder is gone rather than wait forever
+                self.cache.delete(RATE_LIMIT_LOCK_KEY)
+            time.sleep(random.uniform(0.005, 0.02))
+        try:
+            yield
+        finally:
+            self.cache.delete(RATE_LIMIT_LOCK_KEY)
+
+    def _load(self, now):
+        """Return the buckets refilled up to ``now``."""
+        state = self.cache.get(RATE_LIMIT_KEY)
+        if state is None:
+            return {
+                "requests": float(self.requests_per_minute),
+                "tokens": float(self.tokens_per_minute),
+            }
+        elapsed = max(now - state["updated"], 0)
+        return {
+            "requests": min(
+                state["requests"] + elapsed * self.requests_per_minute / 60,
+                self.requests_per_minute,
+            ),
+            "tokens": min(
+                state["tokens"] + elapsed * self.tokens_per_minute / 60,
+                self.tokens_per_minute,
+            ),
+        }
+
+    def _save(self, buckets, now):
+        self.cache.set(RATE_LIMIT_KEY, {**buckets, "updated": now}, timeout=None)
+
+    def acquire(self, tokens=0):
+        """
+        Block until a request using about ``tokens`` tokens fits the limits.
+        Return whether anything was reserved.
+        """
+        if not self.enabled:
+            return False
+
+        # A request larger than the whole budget may still use a full bucket
+        needed = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock():
+                now = time.time()
+                buckets = self._load(now)
+                waits = [0.0]
+                if self.requests_per_minute and buckets["requests"] < 1:
+                    waits.append(
+                        (1 - buckets["requests"]) * 60 / self.requests_per_minute
+                    )
+                if self.tokens_per_minute and buckets["tokens"] < needed:
+                    waits.append(
+                        (needed - buckets["tokens"]) * 60 / self.tokens_per_minute
+                    )
+                delay = max(waits)
+                if not delay:
+                    if self.requests_per_minute:
+                        buckets["requests"] -= 1
+                    if self.tokens_per_minute:
+                        buckets["tokens"] -= tokens
+                    self._save(buckets, now)
+                    return True
+
+            # Jitter so waiting workers don't all retry at the same moment
+            delay += random.uniform(0, 0.5)
+            logger.info(f"Rate limit reached, waiting {delay:.1f}s")
+            time.sleep(delay)
+
+    def record_usage(self, reserved, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the actual usage is known."""
+        if not reserved or not self.tokens_per_minute:
+            return
+        if actual_tokens == estimated_tokens:
+            return
+        with self._lock():
+            now = time.time()
+            buckets = self._load(now)
+            # Going below zero makes later requests wait for the overdraft
+            buckets["tokens"] -= actual_tokens - estimated_tokens
+            self._save(buckets, now)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return a rate limiter configured from the AI_RATE_LIMIT_* settings.
+
+    Raises ImproperlyConfigured when limits are set but the cache is private
+    to each process, as every process would then get the full budget.
+    """
+    limiter = RateLimiter(
+        requests_per_minute=settings.AI_RATE_LIMIT_RPM,
+        tokens_per_minute=settings.AI_RATE_LIMIT_TPM,
+    )
+    if limiter.enabled and is_process_local(caches["default"]):
+        raise ImproperlyConfigured(
+            "AI_RATE_LIMIT_RPM and AI_RATE_LIMIT_TPM need a shared CACHE_URL."
+        )
+    return limiter
+
+
+def get_retry_after(error):
+    """Return the delay in seconds requested by an API error response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error) -> bool:
+    """
+    Whether an API error is worth retrying: 429s, 5xxs, connection errors and
+    streams that ended early.
+    """
+    return isinstance(
+        error,
+        (
+            openai.RateLimitError,
+            openai.InternalServerError,
+            openai.APIConnectionError,
+            IncompleteStreamError,
+        ),
+    )
+
+
+def get_backoff_delay(attempt, retry_after=None) -> float:
+    """Return how long to wait before a retry, with jitter."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    # Full jitter exponential backoff
+    cap = settings.AI_RETRY_MAX_DELAY
+    return random.uniform(0, min(cap, settings.AI_RETRY_BASE_DELAY * 2**attempt))
@@ -0,0 +1,266 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Page, SiteRebuild, SiteRebuildItem
+from .services import AIPageGenerator
+from .utils import get_claimable_filter, run_site_rebuild_in_background
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [SiteRebuild.Status.RUNNING, SiteRebuild.Status.PAUSED]
+
+# Fields a page's generation fingerprint is computed from
+FINGERPRINT_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "ai_prompt",
+    "generation_fingerprint",
+)
+
+
+def _is_stale(page, generator, site_fingerprint) -> bool:
+    return page.generation_fingerprint != generator.get_input_fingerprint(
+        page, site_fingerprint
+    )
+
+
+def get_stale_pages() -> list:
+    """
+    Return the generated pages whose generation inputs changed since.
+
+    Pages are returned most viewed first.
+    """
+    generator = AIPageGenerator()
+    site_fingerprint = generator.get_site_fingerprint()
+    pages = (
+        Page.objects.filter(
+            ~Q(content="") | ~Q(fragment=""),
+            generation_status=Page.PageStatus.COMPLETED,
+        )
+        .only(*FINGERPRINT_FIELDS, "view_count")
+        .order_by("-view_count", "id")
+    )
+    return [
+        page
+        for page in pages.iterator()
+        if _is_stale(page, generator, site_fingerprint)
+    ]
+
+
+def start_site_rebuild(reason="") -> tuple:
+    """
+    Start regenerating every stale page in waves.
+
+    Only one rebuild may be running or paused at a time.
+
+    Args:
+        reason: What changed, shown in the admin
+    """
+    if SiteRebuild.objects.filter(status__in=ACTIVE_STATUSES).exists():
+        return False, "Another site rebuild is already running or paused."
+
+    stale = get_stale_pages()
+    if not stale:
+        return True, "Every page is up to date, no rebuild is needed."
+
+    with transaction.atomic():
+        rebuild = SiteRebuild.objects.create(
+            reason=reason,
+            wave_size=max(1, settings.SITE_REBUILD_WAVE_SIZE),
+            error_budget=settings.SITE_REBUILD_ERROR_BUDGET,
+            total=len(stale),
+        )
+        SiteRebuildItem.objects.bulk_create(
+            [
+                SiteRebuildItem(
+                    rebuild=rebuild, page_id=page.id, priority=page.view_count
+                )
+                for page in stale
+            ],
+            batch_size=1000,
+        )
+
+    success, message = run_site_rebuild_in_background(rebuild.id)
+    if not success:
+        SiteRebuild.objects.filter(id=rebuild.id).update(
+            status=SiteRebuild.Status.PAUSED
+        )
+        return False, f"{rebuild} was created but could not be started: {message}"
+    return True, f"Started {rebuild} of {len(stale)} page(s)."
+
+
+def pause_site_rebuild(rebuild_id) -> bool:
+    """Stop a running rebuild after its current wave."""
+    return bool(
+        SiteRebuild.objects.filter(
+            id=rebuild_id, status=SiteRebuild.Status.RUNNING
+        ).update(status=SiteRebuild.Status.PAUSED)
+    )
+
+
+def cancel_site_rebuild(rebuild_id) -> bool:
+    """Stop a rebuild for good after its current wave."""
+    return bool(
+        SiteRebuild.objects.filter(id=rebuild_id, status__in=ACTIVE_STATUSES).update(
+            status=SiteRebuild.Status.CANCELLED, finished_at=timezone.now()
+        )
+    )
+
+
+def resume_site_rebuild(rebuild_id) -> tuple:
+    """
+    Continue a paused rebuild, or one stopped by its error budget.
+
+    Raise the error budget of a failed rebuild before resuming it, or it
+    stops again after the next failure.
+    """
+    resumed = SiteRebuild.objects.filter(
+        id=rebuild_id,
+        status__in=[SiteRebuild.Status.PAUSED, SiteRebuild.Status.FAILED],
+    ).update(status=SiteRebuild.Status.RUNNING, finished_at=None)
+    if not resumed:
+        return False, "Only paused or failed rebuilds can be resumed."
+    return run_site_rebuild_in_background(rebuild_id)
+
+
+def _finish(rebuild_id, status):
+    SiteRebuild.objects.filter(id=rebuild_id).update(
+        status=status, finished_at=timezone.now(), lease_expires_at=None
+    )
+
+
+def run_site_rebuild_wave(rebuild_id) -> tuple:
+    """
+    Regenerate the next wave of a site rebuild.
+
+    The most viewed pages go first. Each page is checked again before it is
+    regenerated, so pages brought up to date in the meantime are skipped. The
+    item statuses are the checkpoint: a wave interrupted by a crash is picked
+    up again from the items it left running.
+
+    Returns whether more waves remain, and a message.
+    """
+    # Hold the rebuild for this wave, so a rebuild resumed while a wave was
+    # still running doesn't end up with two chains of wave tasks. The lease
+    # runs out with the task timeout, in time for Django Q's redelivery.
+    timeout = (
+        settings.AI_WORKER_TIMEOUT
+        if settings.AI_GENERATION_QUEUE
+        else settings.Q_CLUSTER["timeout"]
+    )
+    now = timezone.now()
+    held = SiteRebuild.objects.filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now),
+        id=rebuild_id,
+        status=SiteRebuild.Status.RUNNING,
+    ).update(lease_expires_at=now + timedelta(seconds=timeout))
+    if not held:
+        return (
+            False,
+            f"Site rebuild {rebuild_id} is not running or is held by another task.",
+        )
+
+    try:
+        rebuild = SiteRebuild.objects.get(id=rebuild_id)
+        items = rebuild.items.all()
+
+        # Items an interrupted wave left running are tried again
+        items.filter(status=SiteRebuildItem.Status.RUNNING).update(
+            status=SiteRebuildItem.Status.PENDING
+        )
+        wave = list(
+            items.filter(status=SiteRebuildItem.Status.PENDING).order_by(
+                "-priority", "id"
+            )[: rebuild.wave_size]
+        )
+        if not wave:
+            _finish(rebuild.id, SiteRebuild.Status.COMPLETED)
+            return False, f"{rebuild} completed."
+
+        SiteRebuildItem.objects.filter(id__in=[item.id for item in wave]).update(
+            status=SiteRebuildItem.Status.RUNNING
+        )
+
+        # Claim the pages that are still stale and not being generated already
+        generator = AIPageGenerator()
+        site_fingerprint = generator.get_site_fingerprint()
+        pages = Page.objects.only(*FINGERPRINT_FIELDS).in_bulk(
+            [item.page_id for item in wave]
+        )
+        stale_ids = [
+            page.id
+            for page in pages.values()
+            if _is_stale(page, generator, site_fingerprint)
+        ]
+        # A retried wave claims with the same id, resuming the pages that the
+        # interrupted attempt left in progress
+        batch_id = f"rebuild-{rebuild.id}-{rebuild.waves}"
+        Page.objects.filter(
+            get_claimable_filter(regenerate=True), id__in=stale_ids
+        ).transition(
+            Page.PageStatus.PENDING, generation_error="", generation_task_id=batch_id
+        )
+        claimed = list(
+            Page.objects.filter(generation_task_id=batch_id).values_list(
+                "id", flat=True
+            )
+        )
+
+        from .tasks import generate_claimed_pages
+
+        results = generate_claimed_pages(claimed, batch_id)
+
+        counts = {status: 0 for status in SiteRebuildItem.Status}
+        for item in wave:
+            if item.page_id not in pages or item.page_id not in stale_ids:
+                item.status, item.error = SiteRebuildItem.Status.SKIPPED, "Up to date"
+            elif item.page_id not in results:
+                item.status = SiteRebuildItem.Status.SKIPPED
+                item.error = "Already being generated"
+            else:
+                success, result = results[item.page_id]
+                if success:
+                    item.status, item.error = SiteRebuildItem.Status.SUCCEEDED, ""
+                else:
+                    item.status = SiteRebuildItem.Status.FAILED
+                    item.error = (
+                        result.get("error", "") if isinstance(result, dict) else result
+                    )
+            counts[item.status] += 1
+        SiteRebuildItem.objects.bulk_update(wave, ["status", "error", "updated_at"])
+
+        SiteRebuild.objects.filter(id=rebuild.id).update(
+            succeeded=F("succeeded") + counts[SiteRebuildItem.Status.SUCCEEDED],
+            failed=F("failed") + counts[SiteRebuildItem.Status.FAILED],
+            skipped=F("skipped") + counts[SiteRebuildItem.Status.SKIPPED],
+            waves=F("waves") + 1,
+            updated_at=timezone.now(),
+        )
+        rebuild.refresh_from_db()
+        message = (
+            f"{rebuild} wave {rebuild.waves}: "
+            f"{counts[SiteRebuildItem.Status.SUCCEEDED]} succeeded, "
+            f"{counts[SiteRebuildItem.Status.FAILED]} failed, "
+            f"{counts[SiteRebuildItem.Status.SKIPPED]} skipped "
+            f"({rebuild.done} of {rebuild.total} done)."
+        )
+
+        # Stop rolling out once too many pages failed
+        if rebuild.failed > rebuild.error_budget:
+            SiteRebuild.objects.filter(
+                id=rebuild.id, status=SiteRebuild.Status.RUNNING
+            ).update(status=SiteRebuild.Status.FAILED, finished_at=timezone.now())
+            return False, f"{message} Stopped, the error budget is spent."
+
+        if rebuild.status != SiteRebuild.Status.RUNNING:
+            return False, f"{message} Stopped, the rebuild is {rebuild.status}."
+        return True, message
+
+    finally:
+        SiteRebuild.objects.filter(id=rebuild_id).update(lease_expires_at=None)
@@ -0,0 +1,77 @@
+import re
+
+from django.template import Context
+
+from .cache import template_cache
+from .layouts import get_active_layout
+from .models import SiteSettings
+
+MAIN_RE = re.compile(r"<main\b[^>]*>.*?</main>", re.IGNORECASE | re.DOTALL)
+TITLE_RE = re.compile(r"<title\b[^>]*>.*?</title>", re.IGNORECASE | re.DOTALL)
+BODY_END_RE = re.compile(r"</body>", re.IGNORECASE)
+
+PAGE_TITLE = "<title>{{ page.title }} - {{ site_settings.company_name }}</title>"
+
+FALLBACK_LAYOUT = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    {PAGE_TITLE}
+</head>
+<body>
+    <main></main>
+</body>
+</html>"""
+
+
+def compose_page(layout_content, fragment) -> str:
+    """Place a generated <main> fragment into a layout template."""
+    # Keep only the <main> element if the model wrapped it in anything else
+    match = MAIN_RE.search(fragment)
+    fragment = match.group(0) if match else f"<main>\n{fragment.strip()}\n</main>"
+
+    layout_content = layout_content or FALLBACK_LAYOUT
+    if MAIN_RE.search(layout_content):
+        html = MAIN_RE.sub(lambda match: fragment, layout_content, count=1)
+    elif BODY_END_RE.search(layout_content):
+        html = BODY_END_RE.sub(
+            lambda match: f"{fragment}\n</body>", layout_content, count=1
+        )
+    else:
+        html = MAIN_RE.sub(lambda match: fragment, FALLBACK_LAYOUT, count=1)
+
+    # Give every page its own title instead of the layout's
+    return TITLE_RE.sub(lambda match: PAGE_TITLE, html, count=1)
+
+
+def get_page_template(page):
+    """Return the compiled template for a page's generated output."""
+    if page.fragment:
+        layout = get_active_layout()
+        return template_cache.get(
+            page.id,
+            (page.content_updated_at, layout.id if layout else None),
+            lambda: compose_page(layout.content if layout else "", page.fragment),
+        )
+    return template_cache.get(page.id, page.content_updated_at, lambda: page.content)
+
+
+def render_page_content(page) -> str:
+    """Render a page's generated content with the site settings."""
+    # Get the compiled template for the page content
+    template = get_page_template(page)
+
+    # Get the site settings
+    site_settings = SiteSettings.get_settings()
+
+    # Create a context with the page and site settings
+    context = Context(
+        {
+            "page": page,
+            "site_settings": site_settings,
+        }
+    )
+
+    # Render the template with the context
+    return template.render(context)
@@ -1,14 +1,78 @@
-import os
-from openai import OpenAI
+import hashlib
+import json
+import logging
+import time
 from django.conf import settings
+from django.db.models import Case, F, When
+from django.db.models.functions import Substr
+from .clients import get_openai_client
+from .completions import (
+    completion_cache_enabled,
+    get_cached_completion,
+    get_completion_key,
+    store_completion,
+)
+from .layouts import get_active_layout, get_or_generate_active_layout
 from .models import SiteSettings, Page
+from .prompts import (
+    CHARS_PER_TOKEN,
+    PromptAssembler,
+    count_tokens,
+    truncate_to_tokens,
+)
+from .ratelimit import (
+    IncompleteStreamError,
+    get_backoff_delay,
+    get_rate_limiter,
+    get_retry_after,
+    is_retryable,
+)
+from .utils import get_remaining_time, raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Site settings included in the page prompt; the others only shape the layout,
+# which is covered by its version
+PAGE_PROMPT_SITE_FIELDS = (
+    "company_name",
+    "preferred_style",
+    "primary_color",
+    "secondary_color",
+    "accent_color",
+    "font_family",
+)
+
+
+class IncompleteCompletionError(Exception):
+    """Raised when the model stopped before finishing a completion."""
+
+
+def check_finish_reason(finish_reason):
+    """Raise if a completion was cut short by the token limit or a filter."""
+    if finish_reason == "length":
+        raise IncompleteCompletionError(
+            "The completion was cut short at the maximum number of tokens."
+        )
+    if finish_reason == "content_filter":
+        raise IncompleteCompletionError(
+            "The completion was cut short by the content filter."
+        )
 
 
 class AIPageGenerator:
     """Service for generating HTML pages using OpenAI based on site settings and user prompts."""
 
-    def __init__(self):
-        self.client = OpenAI(base_url=settings.AI_BASE_URL, api_key=settings.AI_API_KEY)
+    def __init__(self, use_cache=True):
+        self.client = get_openai_client()
+        # Whether cached completions may be reused; fresh ones are always stored
+        self.use_cache = use_cache
+        # Token usage of the latest completion
+        self.last_usage = {}
+        # Number of API calls retried by this generator
+        self.retries = 0
+        # Seconds until the first token of the latest completion arrived
+        self.last_time_to_first_token = None
+        self.rate_limiter = get_rate_limiter()
 
     def _get_site_context(self) -> dict:
         """Returns a dictionary with relevant site settings for layout and styling."""
@@ -27,29 +91,71 @@ class AIPageGenerator:
 
     def _get_previous_page_examples(self, exclude_page_id=None, limit=2) -> str:
         """Fetch a few previous pages to use as examples in the prompt."""
-        pages = Page.objects.exclude(id=exclude_page_id).order_by("-created_at")[:limit]
+        max_tokens = settings.AI_PROMPT_EXAMPLE_TOKENS
+        # Only load a prefix of each page, generously sized for the token cut
+        pages = (
+            Page.objects.with_content()
+            .exclude(id=exclude_page_id)
+            .order_by("-created_at")
+            .annotate(
+                snippet=Substr(
+                    Case(When(fragment="", then=F("content")), default=F("fragment")),
+                    1,
+                    max_tokens * CHARS_PER_TOKEN * 2,
+                )
+            )
+            .values_list("title", "snippet")[:limit]
+        )
         examples = []
-        for p in pages:
-            content_snippet = p.content[:2000]  # avoid token overflow
-            examples.append(f"### PAGE: {p.title}\n{content_snippet}")
+        for title, snippet in pages:
+            content_snippet = truncate_to_tokens(
+                snippet, max_tokens, settings.AI_API_MODEL
+            )
+            examples.append(f"### PAGE: {title}\n{content_snippet}")
         return "\n\n".join(examples)
 
     def _get_layout_template(self) -> str:
-        """Loads the layout template from the file system or generates one if missing."""
-        template_path = os.path.join(
-            settings.BASE_DIR, "pages", "templates", "pages", "generated_layout.html"
-        )
-        if os.path.exists(template_path):
-            with open(template_path, "r") as f:
-                return f.read()
-        else:
-            success, layout = self.generate_layout_template()
-            if success:
-                return layout
-            return ""
+        """Returns the active layout template, generating one if missing."""
+        layout = get_or_generate_active_layout(self)
+        if layout is not None:
+            return layout.content
+        return ""
+
+    def get_site_fingerprint(self) -> str:
+        """Returns a hash of the inputs every page's generation depends on."""
+        layout = get_active_layout()
+        site_context = self._get_site_context()
+        inputs = {
+            "layout": layout.version if layout else None,
+            "site": {field: site_context[field] for field in PAGE_PROMPT_SITE_FIELDS},
+            "model": settings.AI_API_MODEL,
+            "mode": settings.AI_GENERATION_MODE,
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def get_input_fingerprint(self, page, site_fingerprint=None) -> str:
+        """
+        Returns a hash of the inputs a page's generation depends on.
+
+        The example pages are left out, since they change whenever any page
+        is generated. Pass the site_fingerprint when checking many pages, so
+        it is only computed once.
+        """
+        inputs = {
+            "title": page.title,
+            "description": page.description,
+            "ai_prompt": page.ai_prompt,
+            "site": site_fingerprint or self.get_site_fingerprint(),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
 
     def generate_page_content(self, page) -> tuple[bool, str]:
-        """Generates and saves HTML content for a given page using OpenAI."""
+        """
+        Generates HTML content for a given page using OpenAI.
+
+        The content is set on the page but not saved; the caller writes it
+        together with the final generation status.
+        """
         site_context = self._get_site_context()
         layout_template = self._get_layout_template()
         examples = self._get_previous_page_examples(exclude_page_id=page.id)
@@ -57,29 +163,39 @@ class AIPageGenerator:
         if not layout_template:
             return False, "Missing or failed to generate layout template."
 
-        # Construct a structured prompt
-        prompt = f"""
-You are an expert HTML page generator for a content management system.
-
-=== SITE CONTEXT ===
+        # Construct a structured prompt, static sections first so providers can
+        # cache the shared prefix across pages
+        assembler = PromptAssembler(
+            budget=settings.AI_PROMPT_TOKEN_BUDGET,
+            model=settings.AI_API_MODEL,
+            preamble="You are an expert HTML page generator for a content management system.",
+        )
+        assembler.add(
+            "SITE CONTEXT",
+            f"""
 Company Name: {site_context["company_name"]}
 Design Style: {site_context["preferred_style"]}
 Color Scheme: Primary: {site_context["primary_color"]}, Secondary: {site_context["secondary_color"]}, Accent: {site_context["accent_color"]}
 Font Family: {site_context["font_family"]}
-
-=== PAGE DETAILS ===
-Title: {page.title}
-Description: {page.description}
-User Prompt: {page.ai_prompt}
-
-=== PREVIOUS PAGES ===
-{examples}
-
-=== LAYOUT TEMPLATE ===
-{layout_template}
-
-=== TASK ===
-Generate a full HTML5 page using the layout above.
+""",
+        )
+        assembler.add("LAYOUT TEMPLATE", layout_template)
+        fragment_mode = settings.AI_GENERATION_MODE == "fragment"
+        if fragment_mode:
+            task = """
+Generate ONLY the <main> element of the page described below. It will be placed
+into the layout above, replacing the layout's <main> element.
+- Return a single <main>...</main> element and nothing else: no <html>, <head>,
+  <header>, <footer> or <style> elements
+- Reuse the layout's CSS classes and styling conventions
+- Use a heading that reflects the page title
+- Make the content mobile-friendly
+- Return ONLY the HTML code without markdown or explanation
+- The generated code should be accessible and semantic, following WCAG 2.2 guidelines.
+"""
+        else:
+            task = """
+Generate a full HTML5 page using the layout above for the page described below.
 - Preserve the layout's header, navigation, and footer
 - Replace <main> content with new content based on this page
 - Use a heading that reflects the page title
@@ -87,35 +203,187 @@ Generate a full HTML5 page using the layout above.
 - Return ONLY the HTML code without markdown or explanation
 - The generated code should be accessible and semantic, following WCAG 2.2 guidelines.
 """
+        assembler.add("TASK", task)
+        assembler.add("PREVIOUS PAGES", examples, required=False)
+        assembler.add(
+            "PAGE DETAILS",
+            f"""
+Title: {page.title}
+Description: {page.description}
+User Prompt: {page.ai_prompt}
+""",
+        )
+        prompt = assembler.build()
+        logger.info(f"Assembled prompt for page {page.id}: {assembler.token_counts}")
 
-        try:
-            response = self.client.chat.completions.create(
-                model=settings.AI_API_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You generate valid, responsive HTML pages for CMS systems.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-            )
+        messages = [
+            {
+                "role": "system",
+                "content": "You generate valid, responsive HTML pages for CMS systems.",
+            },
+            {"role": "user", "content": prompt},
+        ]
 
-            generated_content = response.choices[0].message.content.strip()
-            page.content = generated_content
-            page.save()
+        try:
+            generated_content = self._create_completion(messages, stream_page=page)
+            generated_content = generated_content.strip()
+            if fragment_mode:
+                # Stored apart from the layout, which is composed in at render time
+                page.fragment = generated_content
+                page.content = ""
+            else:
+                page.content = generated_content
+                page.fragment = ""
+            page.partial_content = ""
 
             return True, generated_content
 
         except Exception as e:
             return False, str(e)
 
+    def _create_completion(self, messages, stream_page=None) -> str:
+        """
+        Returns the completion for the given messages, using the response cache.
+
+        When stream_page is given and streaming is enabled, the partial output
+        is persisted on that page while the completion arrives.
+        """
+        self.last_usage = {}
+        self.last_time_to_first_token = None
+        cache_enabled = completion_cache_enabled()
+        if cache_enabled:
+            key = get_completion_key(settings.AI_API_MODEL, messages)
+            if self.use_cache:
+                content = get_cached_completion(key)
+                if content is not None:
+                    self.last_usage = {"cached_response": True}
+                    return content
+
+        # Reserve the expected tokens against the shared rate limits
+        estimated_tokens = (
+            sum(count_tokens(m["content"], settings.AI_API_MODEL) for m in messages)
+            + settings.AI_RATE_LIMIT_COMPLETION_TOKENS
+        )
+
+        for attempt in range(settings.AI_MAX_RETRIES + 1):
+            raise_if_cancelled()
+            reserved = self.rate_limiter.acquire(estimated_tokens)
+            try:
+                if stream_page is not None and getattr(settings, "AI_STREAMING", False):
+                    content = self._stream_page_content(stream_page, messages)
+                else:
+                    # Don't let a hung request outlive the task's timeout
+                    timeout = get_remaining_time()
+                    started = time.monotonic()
+                    response = self.client.chat.completions.create(
+                        model=settings.AI_API_MODEL,
+                        messages=messages,
+                        **({"timeout": timeout} if timeout is not None else {}),
+                    )
+                    # Retrying wouldn't help, the same request ends the same way
+                    check_finish_reason(response.choices[0].finish_reason)
+                    content = response.choices[0].message.content
+                    # Without streaming the first token comes with the rest
+                    self.last_time_to_first_token = time.monotonic() - started
+                    self._record_usage(response.usage)
+                break
+            except Exception as e:
+                if not is_retryable(e) or attempt >= settings.AI_MAX_RETRIES:
+                    raise
+                delay = get_backoff_delay(attempt, get_retry_after(e))
+                logger.warning(
+                    f"AI API call failed: {str(e)}. Retrying in {delay:.1f}s"
+                )
+                self.retries += 1
+                time.sleep(delay)
+
+        self.rate_limiter.record_usage(
+            reserved,
+            estimated_tokens,
+            self.last_usage.get("prompt_tokens", 0)
+            + self.last_usage.get("completion_tokens", 0)
+            or estimated_tokens,
+        )
+
+        if cache_enabled:
+            store_completion(key, settings.AI_API_MODEL, content)
+        return content
+
+    def _record_usage(self, usage):
+        """Keeps and logs the prompt, cached and completion token counts."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.last_usage = {
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            "completion_tokens": usage.completion_tokens,
+        }
+        logger.info(f"Completion token usage: {self.last_usage}")
+
+    def _stream_page_content(self, page, messages) -> str:
+        """Streams a completion, persisting the partial output at intervals."""
+        flush_interval = getattr(settings, "AI_STREAM_FLUSH_INTERVAL", 1.0)
+
+        # Don't let a hung stream outlive the task's timeout
+        timeout = get_remaining_time()
+        started = time.monotonic()
+        stream = self.client.chat.completions.create(
+            model=settings.AI_API_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **({"timeout": timeout} if timeout is not None else {}),
+        )
+
+        parts = []
+        finish_reason = None
+        # Flush the first chunk right away so waiting visitors see it quickly
+        last_flush = 0.0
+        flushed_length = 0
+        try:
+            for chunk in stream:
+                # Stop reading as soon as the task is cancelled or times out
+                raise_if_cancelled()
+                # The final chunk carries the usage for the whole completion
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if not parts:
+                    self.last_time_to_first_token = time.monotonic() - started
+                parts.append(chunk.choices[0].delta.content)
+
+                now = time.monotonic()
+                if now - last_flush >= flush_interval:
+                    partial_content = "".join(parts)
+                    Page.objects.filter(id=page.id).update(
+                        partial_content=partial_content
+                    )
+                    flushed_length = len(partial_content)
+                    last_flush = now
+        finally:
+            stream.close()
+
+        # A dropped connection can end the stream without an error
+        if finish_reason is None:
+            raise IncompleteStreamError("The completion stream ended early.")
+        check_finish_reason(finish_reason)
+
+        content = "".join(parts)
+        if len(content) != flushed_length:
+            Page.objects.filter(id=page.id).update(partial_content=content)
+        return content
+
     def generate_layout_template(self, site_settings=None) -> tuple[bool, str]:
         """Generates a base layout template using OpenAI based on site settings."""
         if site_settings is None:
             site_settings = SiteSettings.get_settings()
 
         # Check if logo exists
-        has_logo = site_settings.logo is not None
+        has_logo = bool(site_settings.logo)
 
         prompt = f"""
 You are a web layout designer for a content management system.
@@ -144,17 +412,16 @@ Generate a base HTML layout for all pages on this website. It should:
 """
 
         try:
-            response = self.client.chat.completions.create(
-                model=settings.AI_API_MODEL,
-                messages=[
+            content = self._create_completion(
+                [
                     {
                         "role": "system",
                         "content": "You generate clean and professional HTML layout templates.",
                     },
                     {"role": "user", "content": prompt},
-                ],
+                ]
             )
-            return True, response.choices[0].message.content.strip()
+            return True, content.strip()
 
         except Exception as e:
             return False, str(e)
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django_q.signals import pre_execute
+
+from .cache import bump_site_settings_version, invalidate_render, template_cache
+from .lanes import get_queue_lane, record_queue_wait
+from .models import Page, SiteSettings
+from .snapshots import delete_snapshot, publish_snapshot, snapshots_enabled
+from .utils import current_lane, current_queue_wait, current_task_id
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def invalidate_page_caches(sender, instance, **kwargs):
+    """Drop cached render state whenever a page is saved or deleted."""
+    template_cache.invalidate(instance.id)
+    invalidate_render(instance.id)
+
+    if not snapshots_enabled():
+        return
+    if kwargs.get("signal") is post_delete:
+        delete_snapshot(instance.slug)
+        return
+
+    # The web server serves snapshots without checking their version, so
+    # write a new one, or remove it, whenever the rendered page may change
+    update_fields = kwargs.get("update_fields")
+    if update_fields is None or {"content_updated_at", "is_published"} & set(
+        update_fields
+    ):
+        transaction.on_commit(lambda: publish_snapshot(instance))
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_site_settings_caches(sender, instance, **kwargs):
+    """Invalidate every rendered page when the site settings change."""
+
+    def invalidate():
+        bump_site_settings_version()
+
+        # Re-render every snapshot against the new settings
+        if snapshots_enabled():
+            from .utils import rebuild_snapshots_in_background
+
+            rebuild_snapshots_in_background()
+
+    # Wait until other workers can read the change, or they could cache the
+    # old settings under the new version
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_execute)
+def track_current_task(sender, func, task, **kwargs):
+    """Expose the id of the Django Q task about to run to the task itself."""
+    current_task_id.set(task["id"])
+
+    # Measure how long generation tasks waited in their lane
+    lane = get_queue_lane(task.get("cluster"))
+    queue_wait = None
+    if task.get("started"):
+        queue_wait = (timezone.now() - task["started"]).total_seconds()
+    current_lane.set(lane or "")
+    current_queue_wait.set(queue_wait)
+    if lane and queue_wait is not None:
+        record_queue_wait(lane, queue_wait)
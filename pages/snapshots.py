@@ -0,0 +1,196 @@
+import gzip
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponse
+
+from .cache import get_render_version
+from .models import Page
+from .rendering import render_page_content
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MODES = ("off", "file", "x-accel-redirect", "x-sendfile")
+
+
+def get_snapshot_mode() -> str:
+    """Return how published page snapshots are written and served."""
+    return getattr(settings, "PAGE_SNAPSHOT_MODE", "off")
+
+
+def snapshots_enabled() -> bool:
+    return get_snapshot_mode() != "off"
+
+
+def get_snapshot_path(slug) -> Path:
+    """Return the path of the HTML snapshot for a page slug."""
+    return Path(settings.PAGE_SNAPSHOT_ROOT) / f"{slug}.html"
+
+
+def _get_version_path(path) -> Path:
+    """Return the path of the file recording the render version of a snapshot."""
+    return path.with_name(f"{path.name}.version")
+
+
+def get_snapshot_version(slug):
+    """Return the render version a page's snapshot was written for, if any."""
+    try:
+        return _get_version_path(get_snapshot_path(slug)).read_text()
+    except FileNotFoundError:
+        return None
+
+
+def _atomic_write(path, data):
+    """Write data to path so readers never see a partially written file."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def is_publishable(page) -> bool:
+    """
+    Whether a page's rendered output can be served as a static snapshot.
+
+    The live content stays publishable while the page is regenerated, or
+    after a regeneration failed, until new content replaces it.
+    """
+    return bool(page.is_published and (page.content or page.fragment))
+
+
+def write_snapshot(page) -> Path:
+    """Render a page and write its HTML and gzip snapshots atomically."""
+    path = get_snapshot_path(page.slug)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    version = get_render_version(page)
+    data = render_page_content(page).encode()
+
+    # Until the new version is recorded, the snapshot isn't served by Django
+    version_path = _get_version_path(path)
+    version_path.unlink(missing_ok=True)
+    # Write the compressed copy first so it is never older than the HTML
+    _atomic_write(path.with_name(f"{path.name}.gz"), gzip.compress(data, mtime=0))
+    _atomic_write(path, data)
+    _atomic_write(version_path, version.encode())
+    return path
+
+
+def delete_snapshot(slug):
+    """Remove the snapshots for a page slug, if any."""
+    path = get_snapshot_path(slug)
+    _get_version_path(path).unlink(missing_ok=True)
+    path.unlink(missing_ok=True)
+    path.with_name(f"{path.name}.gz").unlink(missing_ok=True)
+
+
+def publish_snapshot(page) -> bool:
+    """Publish stage: write or remove a page's snapshot to match its state."""
+    if not snapshots_enabled():
+        return False
+
+    try:
+        if is_publishable(page):
+            path = write_snapshot(page)
+            logger.info(f"Published snapshot for page {page.id} to {path}")
+            return True
+        delete_snapshot(page.slug)
+    except OSError as e:
+        logger.exception(f"Error publishing snapshot for page {page.id}: {str(e)}")
+    return False
+
+
+def serve_snapshot(request, page):
+    """Return a response serving a page's snapshot, or None if it's unavailable."""
+    mode = get_snapshot_mode()
+    if mode == "off":
+        return None
+
+    # Only serve a snapshot rendered from the page's current content, site
+    # settings and layout, so its body matches the ETag of the response
+    if get_snapshot_version(page.slug) != get_render_version(page):
+        return None
+    path = get_snapshot_path(page.slug)
+
+    if mode == "x-accel-redirect":
+        response = HttpResponse(content_type="text/html; charset=utf-8")
+        response["X-Accel-Redirect"] = (
+            f"{settings.PAGE_SNAPSHOT_ACCEL_PREFIX.rstrip('/')}/{path.name}"
+        )
+        return response
+
+    if mode == "x-sendfile":
+        response = HttpResponse(content_type="text/html; charset=utf-8")
+        response["X-Sendfile"] = str(path)
+        return response
+
+    gzip_path = path.with_name(f"{path.name}.gz")
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    if accepts_gzip and gzip_path.exists():
+        response = FileResponse(
+            open(gzip_path, "rb"), content_type="text/html; charset=utf-8"
+        )
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = FileResponse(
+            open(path, "rb"), content_type="text/html; charset=utf-8"
+        )
+    del response["Content-Disposition"]
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def _rebuild_page_snapshot(page_id) -> bool:
+    try:
+        page = Page.objects.get(id=page_id)
+        write_snapshot(page)
+        return True
+    except Exception as e:
+        logger.exception(f"Error rebuilding snapshot for page {page_id}: {str(e)}")
+        return False
+    finally:
+        # Close this pool thread's connection, it isn't reused
+        connections.close_all()
+
+
+def rebuild_snapshots(workers=4) -> tuple[int, int, int]:
+    """
+    Rebuild the snapshots of every publishable page in parallel.
+
+    Snapshots of pages that are no longer publishable are removed.
+
+    Returns:
+        A tuple of (written, failed, removed) snapshot counts
+    """
+    root = Path(settings.PAGE_SNAPSHOT_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+
+    publishable = dict(
+        Page.objects.with_content().filter(is_published=True).values_list("id", "slug")
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_rebuild_page_snapshot, publishable))
+
+    # Remove snapshots left behind by unpublished, deleted or renamed pages
+    slugs = set(publishable.values())
+    removed = 0
+    for path in root.glob("*.html"):
+        if path.stem not in slugs:
+            delete_snapshot(path.stem)
+            removed += 1
+
+    written = sum(results)
+    return written, len(results) - written, removed
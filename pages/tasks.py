@@ -1,57 +1,211 @@
+import contextvars
+import hashlib
 import logging
-from django.db import transaction
-from .models import Page
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from .models import GenerationRun, Page
+from .lanes import ADMIN
+from .layouts import create_layout
 from .services import AIPageGenerator
+from .snapshots import rebuild_snapshots
+from .telemetry import record_generation_run
+from .utils import (
+    current_queue_wait,
+    current_task_id,
+    enqueue_page_generation,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def generate_page_content(page_id) -> tuple:
+def _claim_page(page_id) -> bool:
+    """Move a page from PENDING to IN_PROGRESS if this task owns its generation."""
+    task_id = current_task_id.get()
+
+    if task_id:
+        # The recorded task, or the first task before its id was recorded, may
+        # claim the page; a redelivery of the recorded task may resume it
+        claimable = Q(
+            generation_status=Page.PageStatus.PENDING,
+            generation_task_id__in=[task_id, ""],
+        ) | Q(
+            generation_status=Page.PageStatus.IN_PROGRESS,
+            generation_task_id=task_id,
+        )
+    else:
+        # Called outside Django Q
+        claimable = Q(generation_status=Page.PageStatus.PENDING)
+
+    return (
+        Page.objects.filter(claimable, id=page_id).transition(
+            Page.PageStatus.IN_PROGRESS,
+            generation_error="",
+            generation_task_id=task_id or F("generation_task_id"),
+        )
+        == 1
+    )
+
+
+def _send_page_saved(page, update_fields):
+    """Run the post_save receivers for a page written with a queryset UPDATE."""
+    post_save.send(
+        sender=Page,
+        instance=page,
+        created=False,
+        update_fields=frozenset(update_fields),
+        raw=False,
+        using=router.db_for_write(Page),
+    )
+
+
+def _generation_record(page, started, error="") -> dict:
+    """
+    Summarise a page generation for the task result.
+
+    The content itself stays on the page; storing it again in every task
+    result would duplicate each page body in the Django Q tables.
+    """
+    content = b""
+    if page.generation_status == Page.PageStatus.COMPLETED:
+        content = (page.fragment or page.content).encode()
+    record = {
+        "page_id": page.id,
+        "status": str(page.generation_status),
+        "content_hash": hashlib.sha256(content).hexdigest()[:16] if content else "",
+        "size": len(content),
+        "duration": round(time.monotonic() - started, 3),
+    }
+    if error:
+        record["error"] = error
+    return record
+
+
+def generate_page_content(page_id, use_cache=True) -> tuple:
     """
     Django Q task to generate content for a page.
 
+    Returns a small record of the generation rather than the generated HTML.
+
     Args:
         page_id: ID of the Page object to generate content for
+        use_cache: Whether a cached LLM response may be reused
     """
+    started = time.monotonic()
+    generator = outcome = None
     try:
-        # Get the page and update its status
-        with transaction.atomic():
-            try:
-                page = Page.objects.select_for_update().get(id=page_id)
-                page.generation_status = Page.PageStatus.IN_PROGRESS
-                page.generation_error = ""
-                page.save()
-            except Page.DoesNotExist:
+        # Claim the page; duplicate deliveries of the generation are dropped
+        if not _claim_page(page_id):
+            if not Page.objects.filter(id=page_id).exists():
                 logger.error(f"Page with ID {page_id} does not exist.")
                 return False, f"Page with ID {page_id} does not exist."
+            logger.warning(
+                f"Dropping duplicate generation task for page {page_id}, "
+                f"another task owns the generation"
+            )
+            return True, f"Duplicate generation task for page {page_id} dropped."
+
+        page = Page.objects.get(id=page_id)
 
         # Generate the content
-        generator = AIPageGenerator()
+        generator = AIPageGenerator(use_cache=use_cache)
         success, result = generator.generate_page_content(page)
 
-        # Update the page with the result
-        with transaction.atomic():
-            page = Page.objects.select_for_update().get(id=page_id)
-            if success:
-                page.generation_status = Page.PageStatus.COMPLETED
-            else:
-                page.generation_status = Page.PageStatus.FAILED
-                page.generation_error = result
-            page.save()
+        # Write the content and the final status in one statement, unless the
+        # page was changed while it was being generated
+        unchanged = Page.objects.filter(id=page_id, version=page.version)
+        if success:
+            fields = {
+                "content": page.content,
+                "fragment": page.fragment,
+                "partial_content": "",
+                "content_updated_at": timezone.now(),
+                "generation_fingerprint": generator.get_input_fingerprint(page),
+            }
+            written = unchanged.transition(Page.PageStatus.COMPLETED, **fields)
+        else:
+            fields = {"generation_error": result, "partial_content": ""}
+            written = unchanged.transition(Page.PageStatus.FAILED, **fields)
+
+        if written:
+            outcome = (
+                GenerationRun.Outcome.SUCCEEDED
+                if success
+                else GenerationRun.Outcome.FAILED
+            )
+        else:
+            # The result may be based on the old inputs, so generate the page
+            # again from the new ones
+            success = False
+            outcome = GenerationRun.Outcome.DISCARDED
+            result = "Page was changed during generation, the result was discarded."
+            fields = {
+                "generation_error": "",
+                "generation_task_id": "",
+                "partial_content": "",
+            }
+            requeued = Page.objects.filter(
+                id=page_id,
+                generation_status=Page.PageStatus.IN_PROGRESS,
+                generation_task_id=page.generation_task_id,
+            ).transition(Page.PageStatus.PENDING, **fields)
+            logger.warning(f"Page {page_id} {result}")
+
+        record_generation_run(
+            GenerationRun.Kind.PAGE,
+            generator,
+            started,
+            outcome,
+            page_id=page_id,
+            error="" if success else result,
+            output=page.fragment or page.content if success else "",
+        )
+
+        if not written and requeued:
+            task_id = enqueue_page_generation(page_id, use_cache=use_cache, lane=ADMIN)
+            result = f"{result} Generating it again in task {task_id}."
+            logger.info(f"Page {page_id} requeued for generation in task {task_id}")
+
+        page.refresh_from_db(
+            fields=[
+                "generation_status",
+                "generation_error",
+                "updated_at",
+                "content_updated_at",
+                "version",
+            ]
+        )
+        # The receivers also publish a static snapshot of the new content
+        _send_page_saved(page, [*fields, "generation_status"])
 
         logger.info(
             f"Page generation completed for page {page_id} with status: {page.generation_status}"
         )
-        return success, result
+        return success, _generation_record(page, started, "" if success else result)
 
     except Exception as e:
         logger.exception(f"Error generating page {page_id}: {str(e)}")
+        # Record generations that failed before their outcome was recorded
+        if generator is not None and outcome is None:
+            record_generation_run(
+                GenerationRun.Kind.PAGE,
+                generator,
+                started,
+                GenerationRun.Outcome.FAILED,
+                page_id=page_id,
+                error=str(e),
+            )
         try:
-            with transaction.atomic():
-                page = Page.objects.select_for_update().get(id=page_id)
-                page.generation_status = Page.PageStatus.FAILED
-                page.generation_error = str(e)
-                page.save()
+            if Page.objects.filter(id=page_id).transition(
+                Page.PageStatus.FAILED, generation_error=str(e)
+            ):
+                page = Page.objects.get(id=page_id)
+                _send_page_saved(page, ["generation_status", "generation_error"])
         except Exception:
             pass
         return False, str(e)
@@ -66,6 +220,7 @@ def generate_layout_template(site_settings_id) -> tuple:
     """
     from .models import SiteSettings
 
+    started = time.monotonic()
     try:
         try:
             site_settings = SiteSettings.objects.get(id=site_settings_id)
@@ -76,27 +231,27 @@ def generate_layout_template(site_settings_id) -> tuple:
         # Generate the layout template
         generator = AIPageGenerator()
         success, result = generator.generate_layout_template(site_settings)
+        record_generation_run(
+            GenerationRun.Kind.LAYOUT,
+            generator,
+            started,
+            GenerationRun.Outcome.SUCCEEDED
+            if success
+            else GenerationRun.Outcome.FAILED,
+            error="" if success else result,
+            output=result if success else "",
+        )
 
         if success:
-            # Create a new file to store the template
-            import os
-            from django.conf import settings
-
-            template_dir = os.path.join(
-                settings.BASE_DIR, "pages", "templates", "pages"
-            )
-            os.makedirs(template_dir, exist_ok=True)
-
-            template_path = os.path.join(template_dir, "generated_layout.html")
-            with open(template_path, "w") as f:
-                f.write(result)
+            # Store the template as a new layout version and activate it
+            layout = create_layout(result)
 
             logger.info(
-                f"Successfully generated layout template. Saved to {template_path}"
+                f"Successfully generated layout template version {layout.version}"
             )
             return (
                 True,
-                f"Successfully generated layout template. Saved to {template_path}",
+                f"Successfully generated layout template version {layout.version}",
             )
         else:
             logger.error(f"Error generating layout template: {result}")
@@ -105,3 +260,98 @@ def generate_layout_template(site_settings_id) -> tuple:
     except Exception as e:
         logger.exception(f"Error generating layout template: {str(e)}")
         return False, str(e)
+
+
+def rebuild_page_snapshots() -> tuple:
+    """
+    Django Q task to rebuild the static snapshots of all published pages.
+    """
+    try:
+        written, failed, removed = rebuild_snapshots()
+        message = f"Wrote {written} snapshot(s), {failed} failed, removed {removed}."
+        logger.info(f"Snapshot rebuild completed. {message}")
+        return failed == 0, message
+
+    except Exception as e:
+        logger.exception(f"Error rebuilding snapshots: {str(e)}")
+        return False, str(e)
+
+
+def generate_claimed_pages(page_ids, batch_id, use_cache=True) -> dict:
+    """
+    Generate content for pages claimed under one task id concurrently.
+
+    Generation is I/O bound, so the pages are generated in a thread pool of
+    AI_BULK_CONCURRENCY workers. Returns the (success, result) of each page
+    keyed by page id.
+    """
+    # Threads don't inherit context variables, so each page runs in a copy of
+    # this task's context: it keeps the lane, the timeout and the cancellation
+    context = contextvars.copy_context()
+    queue_wait = current_queue_wait.get()
+    submitted = time.monotonic()
+
+    def generate(page_id):
+        # Claim with the batch id, and count the wait for a free thread as
+        # queue wait
+        current_task_id.set(batch_id)
+        if queue_wait is not None:
+            current_queue_wait.set(queue_wait + time.monotonic() - submitted)
+        close_old_connections()
+        try:
+            return generate_page_content(page_id, use_cache=use_cache)
+        finally:
+            connections.close_all()
+
+    def run(page_id):
+        return context.copy().run(generate, page_id)
+
+    with ThreadPoolExecutor(max_workers=settings.AI_BULK_CONCURRENCY) as executor:
+        return dict(zip(page_ids, executor.map(run, page_ids)))
+
+
+def generate_pages_bulk(page_ids, batch_id, use_cache=True) -> tuple:
+    """
+    Django Q task to generate content for a batch of pages concurrently.
+
+    Calls to the LLM API are throttled by the shared rate limiter, which keeps
+    every worker process within one budget.
+
+    Args:
+        page_ids: IDs of the Page objects to generate content for
+        batch_id: Task id the pages were claimed with
+        use_cache: Whether a cached LLM response may be reused
+    """
+    results = generate_claimed_pages(page_ids, batch_id, use_cache=use_cache)
+
+    succeeded = sum(success for success, _ in results.values())
+    message = f"Generated {succeeded} of {len(page_ids)} page(s) in batch {batch_id}."
+    logger.info(message)
+    return succeeded == len(page_ids), message
+
+
+def run_site_rebuild(rebuild_id) -> tuple:
+    """
+    Django Q task to run the next wave of a site rebuild.
+
+    Each wave queues the next one when it is done, so a rebuild moves through
+    the site one wave at a time until it completes, fails or is paused.
+
+    Args:
+        rebuild_id: ID of the SiteRebuild to continue
+    """
+    from .rebuilds import run_site_rebuild_wave
+    from .utils import run_site_rebuild_in_background
+
+    try:
+        more, message = run_site_rebuild_wave(rebuild_id)
+        logger.info(message)
+        if more:
+            success, error = run_site_rebuild_in_background(rebuild_id)
+            if not success:
+                return False, f"{message} Scheduling the next wave failed: {error}"
+        return True, message
+
+    except Exception as e:
+        logger.exception(f"Error running site rebuild {rebuild_id}: {str(e)}")
+        return False, str(e)
@@ -0,0 +1,139 @@
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import GenerationRun
+from .utils import current_lane, current_queue_wait, current_task_id
+
+logger = logging.getLogger(__name__)
+
+# Dashboard periods: how far back they reach and the size of their buckets
+PERIODS = {
+    "24h": ("Last 24 hours", timedelta(hours=24), timedelta(hours=1)),
+    "7d": ("Last 7 days", timedelta(days=7), timedelta(days=1)),
+    "30d": ("Last 30 days", timedelta(days=30), timedelta(days=1)),
+}
+DEFAULT_PERIOD = "24h"
+
+
+def record_generation_run(
+    kind, generator, started, outcome, page_id=None, error="", output=""
+):
+    """
+    Record an attempt at a generation.
+
+    Must be called from the task that ran the generation, which knows its
+    queue wait and lane. Failures are logged, never raised, so telemetry
+    can't break a generation.
+
+    Args:
+        kind: GenerationRun.Kind of the generation
+        generator: The AIPageGenerator used, or None if it wasn't created
+        started: time.monotonic() when the generation started
+        outcome: GenerationRun.Outcome of the attempt
+        page_id: ID of the generated page, if any
+        error: Error message of a failed attempt
+        output: The generated content
+    """
+    usage = generator.last_usage if generator is not None else {}
+    try:
+        GenerationRun.objects.create(
+            kind=kind,
+            page_id=page_id,
+            task_id=current_task_id.get(),
+            lane=current_lane.get(),
+            model=settings.AI_API_MODEL,
+            outcome=outcome,
+            error=error,
+            queue_wait=current_queue_wait.get(),
+            time_to_first_token=generator.last_time_to_first_token
+            if generator is not None
+            else None,
+            duration=time.monotonic() - started,
+            prompt_tokens=usage.get("prompt_tokens"),
+            cached_tokens=usage.get("cached_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            output_bytes=len(output.encode()),
+            retries=generator.retries if generator is not None else 0,
+            cached_response=usage.get("cached_response", False),
+        )
+    except Exception as e:
+        logger.exception(f"Error recording generation run: {str(e)}")
+
+
+def prune_generation_runs() -> int:
+    """Delete generation runs older than GENERATION_RUN_RETENTION_DAYS."""
+    cutoff = timezone.now() - timedelta(days=settings.GENERATION_RUN_RETENTION_DAYS)
+    deleted, _ = GenerationRun.objects.filter(created_at__lt=cutoff).delete()
+    if deleted:
+        logger.info(f"Pruned {deleted} generation run(s) older than {cutoff}")
+    return deleted
+
+
+def _percentile(values, p):
+    """Return the nearest-rank percentile of sorted values, if any."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _summarise(runs, span) -> dict:
+    stats = {"runs": len(runs), "per_hour": len(runs) / (span / timedelta(hours=1))}
+    failed = sum(1 for run in runs if run["outcome"] == GenerationRun.Outcome.FAILED)
+    stats["failure_rate"] = failed / len(runs) if runs else 0.0
+    for field in ("duration", "time_to_first_token", "queue_wait"):
+        values = sorted(run[field] for run in runs if run[field] is not None)
+        stats[f"{field}_p50"] = _percentile(values, 50)
+        stats[f"{field}_p95"] = _percentile(values, 95)
+    for field in ("prompt_tokens", "completion_tokens", "retries"):
+        stats[field] = sum(run[field] or 0 for run in runs)
+    return stats
+
+
+def get_generation_stats(queryset, period=DEFAULT_PERIOD) -> dict:
+    """
+    Summarise generation runs over a period, in total and per bucket.
+
+    Percentiles are computed in Python, which is fine for the tens of
+    thousands of runs a busy day produces.
+
+    Args:
+        queryset: GenerationRun queryset to summarise, such as the admin's
+            filtered list
+        period: Key of PERIODS
+    """
+    _, span, step = PERIODS[period]
+    now = timezone.now()
+    since = now - span
+    runs = list(
+        queryset.filter(created_at__gte=since)
+        .order_by()
+        .values(
+            "created_at",
+            "outcome",
+            "duration",
+            "time_to_first_token",
+            "queue_wait",
+            "prompt_tokens",
+            "completion_tokens",
+            "retries",
+        )
+    )
+
+    buckets = [[] for _ in range(math.ceil(span / step))]
+    for run in runs:
+        index = min(int((run["created_at"] - since) / step), len(buckets) - 1)
+        buckets[index].append(run)
+
+    return {
+        "period": period,
+        "total": _summarise(runs, span),
+        "buckets": [
+            {"start": since + i * step, **_summarise(bucket, step)}
+            for i, bucket in reversed(list(enumerate(buckets)))
+        ],
+    }
@@ -1 +1,543 @@
-# Create your tests here.
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .cache import SITE_SETTINGS_VERSION_KEY, get_site_settings_version
+from .checks import check_rate_limit_cache
+from .models import (
+    CompletionCacheEntry,
+    GenerationRun,
+    Page,
+    PageVersionConflict,
+    SiteSettings,
+)
+from .ratelimit import RATE_LIMIT_KEY, RateLimiter, get_rate_limiter
+from .services import AIPageGenerator, IncompleteCompletionError
+from .snapshots import get_snapshot_path
+from .tasks import _claim_page, generate_page_content
+from .utils import current_task_id, generate_page_in_background
+
+
+@contextmanager
+def running_as_task(task_id):
+    """Run the block as if it were the Django Q task with the given id."""
+    token = current_task_id.set(task_id)
+    try:
+        yield
+    finally:
+        current_task_id.reset(token)
+
+
+def create_page(**fields):
+    return Page.objects.create(
+        title=fields.pop("title", "Tea"),
+        slug=fields.pop("slug", "tea"),
+        description="A page about tea.",
+        ai_prompt="Write about tea.",
+        **fields,
+    )
+
+
+class GeneratePageInBackgroundTests(TestCase):
+    def setUp(self):
+        self.page = create_page()
+        patcher = mock.patch("pages.utils.async_task", return_value="task-1")
+        self.async_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueues_and_records_the_task(self):
+        success, _ = generate_page_in_background(self.page.id)
+
+        self.assertTrue(success)
+        self.async_task.assert_called_once()
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.generation_status, Page.PageStatus.PENDING)
+        self.assertEqual(self.page.generation_task_id, "task-1")
+
+    def test_second_call_does_not_enqueue(self):
+        generate_page_in_background(self.page.id)
+        success, message = generate_page_in_background(self.page.id)
+
+        self.assertFalse(success)
+        self.assertEqual(message, "Page generation is already in progress.")
+        self.async_task.assert_called_once()
+
+    def test_call_while_the_first_is_enqueueing_does_not_enqueue(self):
+        results = []
+
+        def enqueue(*args, **kwargs):
+            # Another request arrives before the first one has its task id
+            results.append(generate_page_in_background(self.page.id))
+            return "task-1"
+
+        self.async_task.side_effect = enqueue
+        success, _ = generate_page_in_background(self.page.id)
+
+        self.assertTrue(success)
+        self.assertEqual(self.async_task.call_count, 1)
+        self.assertEqual(results, [(False, "Page generation is already in progress.")])
+
+    def test_missing_page(self):
+        success, _ = generate_page_in_background(self.page.id + 1)
+
+        self.assertFalse(success)
+        self.async_task.assert_not_called()
+
+    def test_enqueue_error_fails_the_page(self):
+        self.async_task.side_effect = ConnectionError("broker down")
+
+        success, _ = generate_page_in_background(self.page.id)
+
+        self.assertFalse(success)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.generation_status, Page.PageStatus.FAILED)
+        # The page can be generated again once the broker is back
+        self.async_task.side_effect = None
+        self.assertTrue(generate_page_in_background(self.page.id)[0])
+
+
+class ConcurrentGenerationRequestTests(TransactionTestCase):
+    def test_concurrent_calls_enqueue_once(self):
+        page = create_page()
+        barrier = threading.Barrier(8)
+        results = []
+
+        def request():
+            barrier.wait()
+            try:
+                results.append(generate_page_in_background(page.id)[0])
+            finally:
+                connections.close_all()
+
+        with mock.patch("pages.utils.async_task", return_value="task-1") as task:
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(task.call_count, 1)
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+
+
+class ClaimPageTests(TestCase):
+    def test_recorded_task_claims_the_page(self):
+        page = create_page(
+            generation_status=Page.PageStatus.PENDING, generation_task_id="task-1"
+        )
+
+        with running_as_task("task-2"):
+            self.assertFalse(_claim_page(page.id))
+        with running_as_task("task-1"):
+            self.assertTrue(_claim_page(page.id))
+
+        page.refresh_from_db()
+        self.assertEqual(page.generation_status, Page.PageStatus.IN_PROGRESS)
+        self.assertEqual(page.generation_task_id, "task-1")
+
+    def test_first_task_claims_a_page_without_a_task_id(self):
+        # The task can start before its id was recorded on the page
+        page = create_page(generation_status=Page.PageStatus.PENDING)
+
+        with running_as_task("task-1"):
+            self.assertTrue(_claim_page(page.id))
+        with running_as_task("task-2"):
+            self.assertFalse(_claim_page(page.id))
+
+        page.refresh_from_db()
+        self.assertEqual(page.generation_task_id, "task-1")
+
+    def test_redelivered_task_resumes_its_generation(self):
+        page = create_page(
+            generation_status=Page.PageStatus.IN_PROGRESS, generation_task_id="task-1"
+        )
+
+        with running_as_task("task-2"):
+            self.assertFalse(_claim_page(page.id))
+        with running_as_task("task-1"):
+            self.assertTrue(_claim_page(page.id))
+
+    def test_claim_outside_django_q(self):
+        page = create_page(
+            generation_status=Page.PageStatus.PENDING, generation_task_id="task-1"
+        )
+
+        self.assertTrue(_claim_page(page.id))
+        # Only a task may resume a generation in progress
+        self.assertFalse(_claim_page(page.id))
+
+        page.refresh_from_db()
+        self.assertEqual(page.generation_task_id, "task-1")
+
+    def test_pages_not_queued_are_not_claimed(self):
+        for status in [Page.PageStatus.NOT_STARTED, Page.PageStatus.COMPLETED]:
+            page = create_page(slug=status, generation_status=status)
+            with running_as_task("task-1"):
+                self.assertFalse(_claim_page(page.id))
+
+
+class GeneratePageContentTests(TestCase):
+    def setUp(self):
+        self.page = create_page(
+            generation_status=Page.PageStatus.PENDING, generation_task_id="task-1"
+        )
+        patcher = mock.patch("pages.utils.async_task", return_value="task-2")
+        self.async_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, edit=None):
+        """Run the generation task, calling edit while the LLM is generating."""
+
+        def generate_page_content_(generator, page):
+            if edit is not None:
+                edit()
+            page.content = "<html><body>Tea</body></html>"
+            return True, page.content
+
+        with (
+            running_as_task("task-1"),
+            mock.patch(
+                "pages.tasks.AIPageGenerator.generate_page_content",
+                autospec=True,
+                side_effect=generate_page_content_,
+            ),
+        ):
+            return generate_page_content(self.page.id)
+
+    def test_stores_the_content(self):
+        success, _ = self.generate()
+
+        self.assertTrue(success)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.generation_status, Page.PageStatus.COMPLETED)
+        self.assertEqual(self.page.content, "<html><body>Tea</body></html>")
+        self.async_task.assert_not_called()
+
+    def test_duplicate_task_is_dropped(self):
+        Page.objects.filter(id=self.page.id).update(generation_task_id="task-0")
+
+        success, result = self.generate()
+
+        self.assertTrue(success)
+        self.assertIn("dropped", result)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.generation_status, Page.PageStatus.PENDING)
+        self.assertEqual(self.page.content, "")
+
+    def test_page_edited_during_generation_is_generated_again(self):
+        def edit():
+            page = Page.objects.get(id=self.page.id)
+            page.title = "Green tea"
+            page.save()
+
+        success, result = self.generate(edit)
+
+        self.assertFalse(success)
+        self.assertIn("changed during generation", result["error"])
+        self.page.refresh_from_db()
+        # The result from the old inputs is discarded and a new task queued
+        self.assertEqual(self.page.title, "Green tea")
+        self.assertEqual(self.page.content, "")
+        self.assertEqual(self.page.generation_status, Page.PageStatus.PENDING)
+        self.assertEqual(self.page.generation_task_id, "task-2")
+        self.async_task.assert_called_once()
+        self.assertEqual(
+            GenerationRun.objects.get(page_id=self.page.id).outcome,
+            GenerationRun.Outcome.DISCARDED,
+        )
+
+    def test_stale_save_does_not_overwrite_generated_content(self):
+        # A copy loaded, like an admin form, before the generation finished
+        stale = Page.objects.get(id=self.page.id)
+        self.generate()
+
+        stale.content = "<html><body>Old</body></html>"
+        with self.assertRaises(PageVersionConflict):
+            stale.save()
+
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.content, "<html><body>Tea</body></html>")
+
+
+def completion_chunk(content=None, finish_reason=None):
+    delta = SimpleNamespace(content=content)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)],
+        usage=None,
+    )
+
+
+class FakeStream(list):
+    def close(self):
+        pass
+
+
+@override_settings(
+    AI_STREAMING=True, AI_RESPONSE_CACHE=True, AI_MAX_RETRIES=2, AI_RETRY_MAX_DELAY=0
+)
+class CompletionFinishReasonTests(TestCase):
+    messages = [{"role": "user", "content": "Write about tea."}]
+
+    def setUp(self):
+        self.page = create_page()
+        self.generator = AIPageGenerator(use_cache=False)
+
+    def stream(self, *streams):
+        """Complete the messages, answering each attempt with the next stream."""
+        with mock.patch.object(
+            self.generator.client.chat.completions,
+            "create",
+            side_effect=[FakeStream(chunks) for chunks in streams],
+        ) as create:
+            try:
+                return self.generator._create_completion(
+                    self.messages, stream_page=self.page
+                )
+            finally:
+                self.attempts = create.call_count
+
+    def test_dropped_stream_is_retried(self):
+        content = self.stream(
+            [completion_chunk("<main>Te")],
+            [
+                completion_chunk("<main>Tea</main>"),
+                completion_chunk(finish_reason="stop"),
+            ],
+        )
+
+        self.assertEqual(content, "<main>Tea</main>")
+        self.assertEqual(self.attempts, 2)
+
+    def test_truncated_stream_fails_without_retrying_or_caching(self):
+        for finish_reason in ["length", "content_filter"]:
+            with self.subTest(finish_reason):
+                with self.assertRaises(IncompleteCompletionError):
+                    self.stream(
+                        [completion_chunk("<main>Te", finish_reason=finish_reason)]
+                    )
+                self.assertEqual(self.attempts, 1)
+        self.assertFalse(CompletionCacheEntry.objects.exists())
+
+    def test_truncated_completion_fails_without_streaming(self):
+        message = SimpleNamespace(content="<main>Te")
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=message, finish_reason="length")],
+            usage=None,
+        )
+        with mock.patch.object(
+            self.generator.client.chat.completions, "create", return_value=response
+        ):
+            with self.assertRaises(IncompleteCompletionError):
+                self.generator._create_completion(self.messages)
+        self.assertFalse(CompletionCacheEntry.objects.exists())
+
+
+class SiteSettingsInvalidationTests(TestCase):
+    def test_version_is_bumped_once_the_change_is_committed(self):
+        version = get_site_settings_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteSettings.get_settings().save()
+            # Other workers can't see the change yet
+            self.assertEqual(get_site_settings_version(), version)
+
+        self.assertNotEqual(get_site_settings_version(), version)
+
+
+class ConditionalRenderTests(TestCase):
+    def setUp(self):
+        self.page = create_page(
+            fragment="<main>Tea</main>",
+            generation_status=Page.PageStatus.COMPLETED,
+            is_published=True,
+        )
+        # HTTP dates have a resolution of seconds, so both changes are made
+        # to have happened a while ago
+        yesterday = timezone.now() - timedelta(days=1)
+        Page.objects.filter(id=self.page.id).update(content_updated_at=yesterday)
+        cache.set(
+            SITE_SETTINGS_VERSION_KEY,
+            int(yesterday.timestamp() * 1e9),
+            timeout=None,
+        )
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get("/tea/")
+
+        revalidated = self.client.get(
+            "/tea/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_site_settings_change_modifies_the_page(self):
+        response = self.client.get("/tea/")
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteSettings.get_settings().save()
+
+        revalidated = self.client.get(
+            "/tea/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(revalidated.status_code, 200)
+
+
+class SnapshotPublishingTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = override_settings(
+            PAGE_SNAPSHOT_MODE="file", PAGE_SNAPSHOT_ROOT=root.name
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page = create_page(
+                fragment="<main>Tea</main>",
+                generation_status=Page.PageStatus.COMPLETED,
+                is_published=True,
+            )
+
+    def test_saved_page_is_republished(self):
+        self.assertIn(b"<main>Tea</main>", get_snapshot_path("tea").read_bytes())
+
+        self.page.fragment = "<main>Green tea</main>"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.save()
+
+        self.assertIn(b"<main>Green tea</main>", get_snapshot_path("tea").read_bytes())
+
+    def test_unpublished_page_is_removed(self):
+        self.page.is_published = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.save()
+
+        self.assertFalse(get_snapshot_path("tea").exists())
+
+
+@override_settings(PAGE_STATUS_LONG_POLL_TIMEOUT=5, PAGE_STATUS_RETRY_AFTER=3)
+class PageStatusTests(TestCase):
+    def setUp(self):
+        self.page = create_page(
+            generation_status=Page.PageStatus.PENDING, is_published=True
+        )
+
+    def test_changed_status_is_answered_at_once(self):
+        response = self.client.get("/status/tea/", {"status": "not_started"})
+
+        self.assertEqual(response.json()["status"], Page.PageStatus.PENDING)
+        self.assertNotIn("Retry-After", response)
+
+    def test_waits_for_a_transition(self):
+        def sleep(seconds):
+            with self.captureOnCommitCallbacks(execute=True):
+                Page.objects.filter(id=self.page.id).transition(
+                    Page.PageStatus.IN_PROGRESS
+                )
+
+        with mock.patch("pages.views.time.sleep", side_effect=sleep) as slept:
+            response = self.client.get("/status/tea/", {"status": "pending"})
+
+        self.assertEqual(response.json()["status"], Page.PageStatus.IN_PROGRESS)
+        self.assertFalse(response.json()["ready"])
+        self.assertEqual(slept.call_count, 1)
+
+    @override_settings(PAGE_STATUS_LONG_POLL_TIMEOUT=0)
+    def test_unchanged_status_asks_to_retry_later(self):
+        response = self.client.get("/status/tea/", {"status": "pending"})
+
+        self.assertEqual(response.json()["status"], Page.PageStatus.PENDING)
+        self.assertEqual(response["Retry-After"], "3")
+
+
+class InputFingerprintTests(TestCase):
+    def setUp(self):
+        self.page = create_page()
+        self.generator = AIPageGenerator()
+        self.fingerprint = self.generator.get_input_fingerprint(self.page)
+
+    def change_settings(self, **fields):
+        site_settings = SiteSettings.get_settings()
+        for name, value in fields.items():
+            setattr(site_settings, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            site_settings.save()
+
+    def test_settings_outside_the_page_prompt_are_left_out(self):
+        self.change_settings(footer_text="New footer", contact_phone="555 0100")
+
+        self.assertEqual(
+            self.generator.get_input_fingerprint(self.page), self.fingerprint
+        )
+
+    def test_settings_in_the_page_prompt_change_it(self):
+        self.change_settings(company_name="Tea & Co")
+
+        self.assertNotEqual(
+            self.generator.get_input_fingerprint(self.page), self.fingerprint
+        )
+
+    def test_page_details_change_it(self):
+        self.page.ai_prompt = "Write about green tea."
+
+        self.assertNotEqual(
+            self.generator.get_input_fingerprint(self.page), self.fingerprint
+        )
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        cache.delete(RATE_LIMIT_KEY)
+        self.now = 1000.0
+        self.sleeps = []
+        patcher = mock.patch.multiple(
+            "pages.ratelimit.time", time=lambda: self.now, sleep=self.sleep
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_requests_refill_continuously(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        for _ in range(60):
+            limiter.acquire()
+        self.assertEqual(self.sleeps, [])
+
+        # A new minute doesn't bring back the whole budget at once
+        self.now += 60 - 0.5
+        for _ in range(59):
+            limiter.acquire()
+        self.assertEqual(self.sleeps, [])
+        limiter.acquire()
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreaterEqual(self.sleeps[0], 0.5)
+
+    def test_token_overdraft_delays_later_requests(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        reserved = limiter.acquire(300)
+        limiter.record_usage(reserved, 300, 900)
+
+        limiter.acquire(100)
+        # 300 tokens overdrawn plus 100 needed, at 10 tokens a second
+        self.assertGreaterEqual(sum(self.sleeps), 40)
+
+    @override_settings(AI_RATE_LIMIT_RPM=60)
+    def test_process_local_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_rate_limiter()
+        self.assertEqual([e.id for e in check_rate_limit_cache(None)], ["pages.E001"])
+
+    def test_disabled_limiter_does_not_reserve(self):
+        self.assertIs(get_rate_limiter().acquire(100), False)
+        self.assertEqual(check_rate_limit_cache(None), [])
@@ -1,43 +1,259 @@
 import logging
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
 from django_q.tasks import async_task
 
+from .lanes import BULK, INTERACTIVE, LAYOUT, get_lane_queue
+
 logger = logging.getLogger(__name__)
 
+PRUNE_TASK_RESULTS_KEY = "pages:prune-task-results"
+PRUNE_TASK_RESULTS_INTERVAL = 3600
+
+# Id of the Django Q task being executed, set by a pre_execute signal handler
+current_task_id = ContextVar("current_task_id", default="")
+
+# Lane of the Django Q task being executed and the seconds it was queued for
+current_lane = ContextVar("current_lane", default="")
+current_queue_wait = ContextVar("current_queue_wait", default=None)
+
+# Cancellation state of the task being executed by the threaded worker
+current_cancel_event = ContextVar("current_cancel_event", default=None)
+current_deadline = ContextVar("current_deadline", default=None)
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a task that was cancelled or ran past its timeout."""
+
+
+def get_remaining_time():
+    """Return the seconds left before the current task times out, if limited."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def raise_if_cancelled():
+    """Stop the current task if it was cancelled or ran out of time."""
+    if get_remaining_time() == 0:
+        raise GenerationCancelled("Task timed out.")
+    event = current_cancel_event.get()
+    if event is not None and event.is_set():
+        raise GenerationCancelled("Task was cancelled.")
+
 
-def generate_page_in_background(page_id, generator_class=None):
+def _queue_options(lane) -> dict:
+    """Return the async_task options routing a task to its lane's queue."""
+    queue = get_lane_queue(lane)
+    if queue:
+        return {"cluster": queue}
+    return {}
+
+
+def get_claimable_filter(regenerate=False) -> Q:
+    """Return a filter matching pages that may be moved to PENDING."""
+    from .models import Page
+
+    claimable = Q(
+        generation_status__in=[
+            Page.PageStatus.NOT_STARTED,
+            Page.PageStatus.FAILED,
+        ]
+    ) | Q(generation_status=Page.PageStatus.COMPLETED, content="", fragment="")
+    if regenerate:
+        claimable |= Q(generation_status=Page.PageStatus.COMPLETED)
+    return claimable
+
+
+def enqueue_page_generation(page_id, use_cache=True, lane=INTERACTIVE) -> str:
     """
-    Generate content for a page using Django Q.
+    Queue the generation task of a page its caller moved to PENDING.
 
-    Args:
-        page_id: ID of the Page object to generate content for
-        generator_class: Class to use for generation (not used with Django Q)
+    The page is marked FAILED if the task can't be queued.
+
+    Returns the id of the queued task.
     """
     from .models import Page
 
     try:
-        # Get the page and update its status
-        page = Page.objects.get(id=page_id)
-        page.generation_status = Page.PageStatus.PENDING
-        page.generation_error = ""
-        page.save()
-
         # Schedule the task with Django Q
         task_id = async_task(
             "pages.tasks.generate_page_content",
             page_id,
+            use_cache=use_cache,
             hook="pages.utils.task_completion_hook",
+            **_queue_options(lane),
+        )
+    except Exception as e:
+        Page.objects.filter(
+            id=page_id, generation_status=Page.PageStatus.PENDING
+        ).transition(
+            Page.PageStatus.FAILED,
+            generation_error=f"Error scheduling generation: {str(e)}",
+        )
+        raise
+
+    # Record the task so duplicate deliveries can be told apart
+    Page.objects.filter(id=page_id, generation_task_id="").update(
+        generation_task_id=task_id
+    )
+    return task_id
+
+
+def generate_page_in_background(
+    page_id, generator_class=None, regenerate=False, use_cache=True, lane=INTERACTIVE
+):
+    """
+    Generate content for a page using Django Q.
+
+    Only the caller that moves the page to PENDING enqueues a task, so
+    concurrent requests for the same page never start duplicate generations.
+    The others get False, and can check whether the page is generating.
+
+    Args:
+        page_id: ID of the Page object to generate content for
+        generator_class: Class to use for generation (not used with Django Q)
+        regenerate: Whether pages that already have content may be regenerated
+        use_cache: Whether a cached LLM response may be reused
+        lane: Priority lane to queue the task in
+    """
+    from .models import Page
+
+    try:
+        # Atomically move the page to PENDING, unless someone else already did
+        claimed = (
+            Page.objects.filter(
+                get_claimable_filter(regenerate), id=page_id
+            ).transition(
+                Page.PageStatus.PENDING,
+                generation_error="",
+                generation_task_id="",
+            )
+            == 1
         )
 
+        if not claimed:
+            if not Page.objects.filter(id=page_id).exists():
+                return False, f"Page with ID {page_id} does not exist."
+            logger.info(f"Generation for page {page_id} is already scheduled")
+            return False, "Page generation is already in progress."
+
+        task_id = enqueue_page_generation(page_id, use_cache=use_cache, lane=lane)
+
         logger.info(f"Scheduled page generation task {task_id} for page {page_id}")
         return True, "Page generation scheduled in the background."
 
-    except Page.DoesNotExist:
-        return False, f"Page with ID {page_id} does not exist."
     except Exception as e:
         logger.exception(f"Error scheduling generation for page {page_id}: {str(e)}")
         return False, str(e)
 
 
+def generate_pages_in_background(page_ids, regenerate=True, use_cache=True):
+    """
+    Generate content for many pages using Django Q.
+
+    Pages are claimed and enqueued in batches of AI_BULK_BATCH_SIZE, one task
+    per batch, instead of one task per page. Each batch is claimed with a
+    single UPDATE; pages that are already being generated are skipped.
+
+    Args:
+        page_ids: IDs of the Page objects to generate content for
+        regenerate: Whether pages that already have content may be regenerated
+        use_cache: Whether a cached LLM response may be reused
+    """
+    from .models import Page
+
+    page_ids = list(page_ids)
+    batch_size = max(1, settings.AI_BULK_BATCH_SIZE)
+    scheduled = 0
+    batches = 0
+
+    try:
+        for start in range(0, len(page_ids), batch_size):
+            batch_id = f"bulk-{uuid.uuid4().hex[:27]}"
+            Page.objects.filter(
+                get_claimable_filter(regenerate),
+                id__in=page_ids[start : start + batch_size],
+            ).transition(
+                Page.PageStatus.PENDING,
+                generation_error="",
+                generation_task_id=batch_id,
+            )
+            claimed = list(
+                Page.objects.filter(generation_task_id=batch_id).values_list(
+                    "id", flat=True
+                )
+            )
+            if not claimed:
+                continue
+
+            try:
+                async_task(
+                    "pages.tasks.generate_pages_bulk",
+                    claimed,
+                    batch_id,
+                    use_cache=use_cache,
+                    hook="pages.utils.task_completion_hook",
+                    **_queue_options(BULK),
+                )
+            except Exception as e:
+                Page.objects.filter(
+                    generation_task_id=batch_id,
+                    generation_status=Page.PageStatus.PENDING,
+                ).transition(
+                    Page.PageStatus.FAILED,
+                    generation_error=f"Error scheduling generation: {str(e)}",
+                )
+                raise
+
+            scheduled += len(claimed)
+            batches += 1
+            logger.info(
+                f"Scheduled bulk generation batch {batch_id} for {len(claimed)} page(s)"
+            )
+
+    except Exception as e:
+        logger.exception(f"Error scheduling bulk page generation: {str(e)}")
+        return False, str(e)
+
+    skipped = len(page_ids) - scheduled
+    message = f"Scheduled generation of {scheduled} page(s) in {batches} batch(es)."
+    if skipped:
+        message += f" {skipped} page(s) were already in progress."
+    return True, message
+
+
+def run_site_rebuild_in_background(rebuild_id):
+    """
+    Run the next wave of a site rebuild using Django Q.
+
+    Args:
+        rebuild_id: ID of the SiteRebuild to continue
+    """
+    try:
+        task_id = async_task(
+            "pages.tasks.run_site_rebuild",
+            rebuild_id,
+            hook="pages.utils.task_completion_hook",
+            **_queue_options(BULK),
+        )
+
+        logger.info(f"Scheduled site rebuild task {task_id} for rebuild {rebuild_id}")
+        return True, "Site rebuild wave scheduled in the background."
+
+    except Exception as e:
+        logger.exception(f"Error scheduling site rebuild {rebuild_id}: {str(e)}")
+        return False, str(e)
+
+
 def generate_layout_in_background(site_settings_id):
     """
     Generate layout template using Django Q.
@@ -51,6 +267,7 @@ def generate_layout_in_background(site_settings_id):
             "pages.tasks.generate_layout_template",
             site_settings_id,
             hook="pages.utils.layout_task_completion_hook",
+            **_queue_options(LAYOUT),
         )
 
         logger.info(
@@ -63,6 +280,40 @@ def generate_layout_in_background(site_settings_id):
         return False, str(e)
 
 
+def rebuild_snapshots_in_background():
+    """
+    Rebuild the static snapshots of all published pages using Django Q.
+    """
+    try:
+        task_id = async_task(
+            "pages.tasks.rebuild_page_snapshots",
+            hook="pages.utils.task_completion_hook",
+        )
+
+        logger.info(f"Scheduled snapshot rebuild task {task_id}")
+        return True, "Snapshot rebuild scheduled in the background."
+
+    except Exception as e:
+        logger.exception(f"Error scheduling snapshot rebuild: {str(e)}")
+        return False, str(e)
+
+
+def prune_task_results() -> int:
+    """
+    Delete Django Q task results older than TASK_RESULT_RETENTION_DAYS.
+
+    Django Q only bounds the number of successful results it keeps, so
+    failures would otherwise pile up forever.
+    """
+    from django_q.models import Task
+
+    cutoff = timezone.now() - timedelta(days=settings.TASK_RESULT_RETENTION_DAYS)
+    deleted, _ = Task.objects.filter(stopped__lt=cutoff).delete()
+    if deleted:
+        logger.info(f"Pruned {deleted} task result(s) older than {cutoff}")
+    return deleted
+
+
 def task_completion_hook(task):
     """
     Hook function called when a task is completed.
@@ -70,6 +321,16 @@ def task_completion_hook(task):
     Args:
         task: The completed task object
     """
+    # Prune old task results at most once per interval across all workers
+    if cache.add(PRUNE_TASK_RESULTS_KEY, True, timeout=PRUNE_TASK_RESULTS_INTERVAL):
+        from .telemetry import prune_generation_runs
+
+        try:
+            prune_task_results()
+            prune_generation_runs()
+        except Exception as e:
+            logger.exception(f"Error pruning task results: {str(e)}")
+
     success = task.result[0] if isinstance(task.result, tuple) else task.result
     result = (
         task.result[1]
@@ -1,36 +1,89 @@
+import time
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.functions import Substr
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse
-from django.template import Template, Context
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+    patch_cache_control,
+)
+from django.utils.http import http_date
+from .cache import (
+    get_cached_render,
+    get_generation_status_version,
+    get_render_etag,
+    get_render_last_modified,
+    get_render_version,
+    record_page_view,
+    set_cached_render,
+)
 from .models import Page, SiteSettings
+from .rendering import render_page_content
 from .services import AIPageGenerator
+from .snapshots import serve_snapshot
 from .utils import generate_page_in_background
 
 
-def render_page(request, slug):
-    """Render a page based on its slug."""
-    # Get the page or return 404
-    page = get_object_or_404(Page, slug=slug, is_published=True)
+def _render_live_page(request, page):
+    """Serve a page's live content from the rendered-response cache, rendering it on a miss."""
+    version = get_render_version(page)
+    etag = get_render_etag(version)
+    last_modified = get_render_last_modified(page)
 
-    # If the page has content and generation is complete, render it directly
-    if page.content and page.generation_status == Page.PageStatus.COMPLETED:
-        # Create a Template object from the page content
-        template = Template(page.content)
+    # Answer conditional requests without rendering anything
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
 
-        # Get the site settings
-        site_settings = SiteSettings.get_settings()
+    if response is None:
+        # Serve the published snapshot from disk when available
+        response = serve_snapshot(request, page)
+
+    if response is None:
+        rendered_content = get_cached_render(page.id, version)
+
+        if rendered_content is None:
+            rendered_content = render_page_content(page)
+            set_cached_render(page.id, version, rendered_content)
+
+        response = HttpResponse(rendered_content)
+
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+
+    # While new content is generated, caches may keep serving this version
+    # but should check back for the new one on every request
+    regenerating = page.generation_status in [
+        Page.PageStatus.PENDING,
+        Page.PageStatus.IN_PROGRESS,
+    ]
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=0 if regenerating else settings.PAGE_CACHE_MAX_AGE,
+        stale_while_revalidate=settings.PAGE_CACHE_STALE_WHILE_REVALIDATE,
+    )
+    return response
 
-        # Create a context with the page and site settings
-        context = Context(
-            {
-                "page": page,
-                "site_settings": site_settings,
-            }
-        )
 
-        # Render the template with the context
-        rendered_content = template.render(context)
+def render_page(request, slug):
+    """Render a page based on its slug."""
+    # Get the page or return 404, leaving the content to be loaded on demand
+    page = get_object_or_404(
+        Page.objects.defer("content", "fragment", "partial_content").annotate(
+            has_content=ExpressionWrapper(
+                ~Q(content="") | ~Q(fragment=""), output_field=BooleanField()
+            )
+        ),
+        slug=slug,
+        is_published=True,
+    )
 
-        return HttpResponse(rendered_content)
+    # If the page has content, render it directly, even while it is being
+    # regenerated or after a regeneration failed
+    if page.has_content:
+        record_page_view(page.id)
+        return _render_live_page(request, page)
 
     # Check if generation is in progress or pending
     elif page.generation_status in [
@@ -38,19 +91,22 @@ def render_page(request, slug):
         Page.PageStatus.IN_PROGRESS,
     ]:
         # Show a page indicating that generation is in progress
-        return render(
+        response = render(
             request,
             "pages/generation_in_progress.html",
             {
                 "page": page,
                 "site_settings": SiteSettings.get_settings(),
+                "streaming": getattr(settings, "AI_STREAMING", False),
             },
         )
+        add_never_cache_headers(response)
+        return response
 
     # Check if generation failed
     elif page.generation_status == Page.PageStatus.FAILED:
         # Show a page with the error message
-        return render(
+        response = render(
             request,
             "pages/generation_failed.html",
             {
@@ -58,13 +114,15 @@ def render_page(request, slug):
                 "site_settings": SiteSettings.get_settings(),
             },
         )
+        add_never_cache_headers(response)
+        return response
 
     # If no content and generation not started, start it in the background
     else:
         # Start generation in the background
         success, message = generate_page_in_background(page.id, AIPageGenerator)
 
-        if success:
+        if success or Page.objects.filter(id=page.id).generating().exists():
             # Redirect back to the same page to show the "in progress" template
             return redirect("render_page", slug=slug)
         else:
@@ -82,9 +140,134 @@ def generate_page(request, slug):
     # Start generation in the background
     success, message = generate_page_in_background(page.id, AIPageGenerator)
 
-    if success:
+    if success or Page.objects.filter(id=page.id).generating().exists():
         # Redirect back to the page
         return redirect("render_page", slug=slug)
     else:
         # If starting generation fails, return a 500 error
         return HttpResponse(f"Error starting page generation: {message}", status=500)
+
+
+# Characters at the end of the streamed output checked for a restart
+STREAM_TAIL_LENGTH = 64
+
+
+def _stream_generation(page):
+    """Yield a page's generated HTML as it is produced."""
+    poll_interval = getattr(settings, "AI_STREAM_POLL_INTERVAL", 0.5)
+    deadline = time.monotonic() + settings.Q_CLUSTER["timeout"]
+    in_progress = [Page.PageStatus.PENDING, Page.PageStatus.IN_PROGRESS]
+    reload = f'<script>window.location.replace("{page.get_absolute_url()}");</script>'
+    sent = ""
+
+    while True:
+        # Only load the output not sent yet, and the end of what was sent
+        fields = {"unsent": Substr("partial_content", len(sent) + 1)}
+        tail = sent[-STREAM_TAIL_LENGTH:]
+        if tail:
+            fields["tail"] = Substr(
+                "partial_content", len(sent) - len(tail) + 1, len(tail)
+            )
+        row = (
+            Page.objects.filter(id=page.id)
+            .annotate(**fields)
+            .values("generation_status", *fields)
+            .first()
+        )
+        if row is None:
+            return
+
+        # A retried generation starts its output over; reload to stream it
+        # again instead of appending it to what was already sent
+        if tail and row["tail"] != tail:
+            yield reload
+            return
+        if row["unsent"]:
+            yield row["unsent"]
+            sent += row["unsent"]
+
+        if row["generation_status"] not in in_progress:
+            # Reload to get the fully rendered page, or the failure page
+            yield reload
+            return
+
+        if time.monotonic() > deadline:
+            return
+        time.sleep(poll_interval)
+
+
+def stream_page(request, slug):
+    """Stream the HTML of a page while its content is being generated."""
+    page = get_object_or_404(
+        Page.objects.only("id", "slug", "generation_status"),
+        slug=slug,
+        is_published=True,
+    )
+
+    if page.generation_status not in [
+        Page.PageStatus.PENDING,
+        Page.PageStatus.IN_PROGRESS,
+    ]:
+        return redirect("render_page", slug=slug)
+
+    response = StreamingHttpResponse(
+        _stream_generation(page), content_type="text/html; charset=utf-8"
+    )
+    response["Cache-Control"] = "no-store"
+    # Ask nginx not to buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def page_status(request, slug):
+    """
+    Report a page's generation status, long-polling until it changes.
+
+    Clients pass the status they last saw as ``?status=``; the response is
+    held until the status differs or PAGE_STATUS_LONG_POLL_TIMEOUT expires.
+    While waiting only a stamp in the shared cache is polled, and the page is
+    read again when a generation status changed. Requests that time out are
+    answered with a Retry-After hint, so waiting tabs don't hold a worker
+    all the time.
+    """
+    known_status = request.GET.get("status")
+    poll_interval = getattr(settings, "PAGE_STATUS_POLL_INTERVAL", 0.5)
+    deadline = time.monotonic() + getattr(settings, "PAGE_STATUS_LONG_POLL_TIMEOUT", 10)
+    queryset = Page.objects.filter(slug=slug, is_published=True).only(
+        "generation_status", "updated_at"
+    )
+
+    while True:
+        status_version = get_generation_status_version()
+        page = queryset.first()
+        if page is None:
+            raise Http404("No Page matches the given query.")
+
+        if page.generation_status != known_status:
+            break
+        while (
+            time.monotonic() < deadline
+            and get_generation_status_version() == status_version
+        ):
+            time.sleep(poll_interval)
+        if time.monotonic() >= deadline:
+            break
+
+    ready = page.generation_status not in [
+        Page.PageStatus.PENDING,
+        Page.PageStatus.IN_PROGRESS,
+    ]
+
+    response = JsonResponse(
+        {
+            "status": page.generation_status,
+            "status_display": page.get_generation_status_display(),
+            "updated_at": page.updated_at.isoformat(),
+            "ready": ready,
+        }
+    )
+    response["Cache-Control"] = "no-store"
+    # Ask clients to wait before asking again when nothing changed
+    if not ready and page.generation_status == known_status:
+        response["Retry-After"] = str(getattr(settings, "PAGE_STATUS_RETRY_AFTER", 5))
+    return response
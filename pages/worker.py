@@ -0,0 +1,195 @@
+import logging
+import os
+import pydoc
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from django_q.brokers import get_broker
+from django_q.monitor import save_task
+from django_q.signals import post_execute, pre_execute
+from django_q.signing import BadSignature, SignedPackage
+
+from .utils import current_cancel_event, current_deadline, current_task_id
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedWorker:
+    """
+    Runs the Django Q tasks of a set of queues concurrently in a thread pool.
+
+    Queues are lanes given in priority order, each with a cap on the threads
+    it may use. Free threads always go to the highest priority lane with
+    queued work, so visitor-triggered generations skip ahead of bulk runs.
+
+    Generation tasks spend nearly all their time waiting on the LLM API, so a
+    single process can keep many of them in flight. Timeouts and cancellation
+    are cooperative: a task past its deadline has its cancel event set and
+    stops at the next check. Threads that still don't finish are reported as
+    stuck, and once every slot is stuck the worker exits so its supervisor
+    can start a fresh process.
+    """
+
+    def __init__(self, lanes, threads=16, timeout=300, poll_interval=1.0, grace=30):
+        # (name, broker, max threads) for each lane, highest priority first
+        self.lanes = [
+            (name, get_broker(queue), min(max_threads, threads))
+            for name, queue, max_threads in lanes
+        ]
+        self.threads = threads
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.grace = grace
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Stop taking new tasks and cancel the running ones."""
+        self._stopping.set()
+        with self._lock:
+            for entry in self._running.values():
+                entry["cancel"].set()
+
+    def run(self) -> int:
+        """Process tasks until stopped. Returns the number of stuck threads."""
+        executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="generation"
+        )
+        queues = ", ".join(broker.list_key for _, broker, _ in self.lanes)
+        logger.info(
+            f"Generation worker {os.getpid()} ready for work on {queues} "
+            f"with {self.threads} threads"
+        )
+        try:
+            while not self._stopping.is_set():
+                stuck = self._check_timeouts()
+                if stuck >= self.threads:
+                    logger.error(
+                        f"All {stuck} worker threads are stuck, stopping the worker"
+                    )
+                    break
+
+                if not self._dispatch(executor):
+                    self._stopping.wait(self.poll_interval)
+        finally:
+            self.stop()
+            stuck = self._wait_for_tasks()
+            executor.shutdown(wait=not stuck, cancel_futures=True)
+        return stuck
+
+    def _free_slots(self, lane) -> int:
+        """Return how many more tasks a lane may start right now."""
+        with self._lock:
+            in_lane = sum(1 for e in self._running.values() if e["lane"] == lane[0])
+            return min(self.threads - len(self._running), lane[2] - in_lane)
+
+    def _dispatch(self, executor) -> bool:
+        """Start a task from the highest priority lane that has one."""
+        for lane in self.lanes:
+            if self._free_slots(lane) <= 0:
+                continue
+            name, broker, _ = lane
+            try:
+                packages = broker.dequeue()
+            except Exception:
+                logger.exception(f"Failed to pull tasks from {broker.list_key}")
+                continue
+            if not packages:
+                continue
+
+            for ack_id, payload in packages:
+                try:
+                    task = SignedPackage.loads(payload)
+                except (TypeError, BadSignature):
+                    logger.exception("Failed to unpack task")
+                    broker.fail(ack_id)
+                    continue
+                task["cluster"] = broker.list_key
+                task["ack_id"] = ack_id
+                timeout = task.pop("timeout", None) or self.timeout
+
+                entry = {
+                    "task": task,
+                    "lane": name,
+                    "broker": broker,
+                    "cancel": threading.Event(),
+                    "deadline": time.monotonic() + timeout,
+                }
+                with self._lock:
+                    self._running[task["id"]] = entry
+                executor.submit(self._execute, entry)
+            # Check the higher priority lanes again before taking more
+            return True
+        return False
+
+    def _check_timeouts(self) -> int:
+        """Cancel tasks past their deadline. Returns the number of stuck ones."""
+        now = time.monotonic()
+        stuck = 0
+        with self._lock:
+            for entry in self._running.values():
+                if now < entry["deadline"]:
+                    continue
+                if not entry["cancel"].is_set():
+                    logger.warning(f"Task {entry['task']['name']} timed out")
+                    entry["cancel"].set()
+                if now >= entry["deadline"] + self.grace:
+                    stuck += 1
+        return stuck
+
+    def _wait_for_tasks(self) -> int:
+        """Wait for running tasks to stop. Returns the number still running."""
+        deadline = time.monotonic() + self.grace
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._running:
+                    return 0
+            time.sleep(0.1)
+        with self._lock:
+            return len(self._running)
+
+    def _execute(self, entry):
+        """Run one task and save its result, as a Django Q worker would."""
+        task = entry["task"]
+        broker = entry["broker"]
+        current_task_id.set(task["id"])
+        current_cancel_event.set(entry["cancel"])
+        current_deadline.set(entry["deadline"])
+        close_old_connections()
+
+        try:
+            func = task["func"]
+            if not callable(func):
+                func = pydoc.locate(func)
+            pre_execute.send(sender="django_q", func=func, task=task)
+            try:
+                if func is None:
+                    raise ValueError(f"Function {task['func']} is not defined")
+                task["result"] = func(*task["args"], **task["kwargs"])
+                task["success"] = True
+            except Exception as e:
+                task["result"] = f"{e} : {traceback.format_exc()}"
+                task["success"] = False
+            task["stopped"] = timezone.now()
+
+            save_task(task, broker)
+            ack_id = task.pop("ack_id", False)
+            if ack_id and (task["success"] or task.get("ack_failure", False)):
+                broker.acknowledge(ack_id)
+            post_execute.send(sender="django_q", task=task)
+
+            if task["success"]:
+                logger.info(f"Processed {task['name']}")
+            else:
+                logger.error(f"Failed {task['name']} - {task['result']}")
+        except Exception:
+            logger.exception(f"Error running task {task['name']}")
+        finally:
+            with self._lock:
+                self._running.pop(task["id"], None)
+            connections.close_all()